@@ -0,0 +1,313 @@
+"""
+Bulk offline rendering for the image agent.
+
+Streams images from a directory or a JSONL manifest through the same
+normalize/enhance/filter/crop/encode pipeline as /process-images, on a pool of
+worker processes, and writes every variant straight to disk as
+<output>/<id>/<platform>/<variant>.jpg.
+
+Every finished image is appended to a checkpoint file with the outputs it
+wrote, keyed by platform and variant. Started again with the same checkpoint,
+a run renders only the outputs still missing, so an interrupted run picks up
+where it stopped and a rerun with more platforms or filters renders just the
+new ones. Outputs written with a different crop mode, background or quality
+are rendered again.
+
+Manifest lines are JSON objects with `path` or `url`, plus optional `id`,
+`platforms` and `filters` overriding the command-line defaults. Ids default to
+the path relative to the manifest (or the URL's host and path) and must stay
+inside the output directory. Lines that can't be used are recorded as failed
+jobs.
+
+Usage:
+    python batch_images.py INPUT --output DIR [--platforms instagram_post,linkedin]
+                           [--filters enhanced,vibrant] [--workers 4] [--checkpoint FILE]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from urllib.parse import urlparse
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+# Per-worker settings, set by init_worker
+worker_options = None
+
+
+def iter_directory(root):
+    """Jobs for every image under a directory, keyed by relative path"""
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                path = os.path.join(folder, name)
+                yield {"id": os.path.relpath(path, root).replace(os.sep, "/"), "path": path}
+
+
+def check_job_id(job_id):
+    """Reject ids that would write outside the output directory"""
+    if not isinstance(job_id, str) or not job_id:
+        raise ValueError(f"invalid id {job_id!r}")
+    parts = job_id.replace("\\", "/").split("/")
+    if os.path.isabs(job_id) or ".." in parts or "" in parts:
+        raise ValueError(f"id {job_id!r} must be a relative path without '..'")
+    return job_id
+
+
+def default_job_id(job, base):
+    """Manifest id for entries without one: relative path, or URL host and path"""
+    if "path" in job:
+        relative = os.path.relpath(job["path"], base)
+        if relative.startswith(".."):
+            relative = os.path.splitdrive(os.path.abspath(job["path"]))[1].lstrip(os.sep)
+        return relative.replace(os.sep, "/")
+    parsed = urlparse(job["url"])
+    job_id = (parsed.netloc + parsed.path).strip("/")
+    if parsed.query:
+        job_id += "-" + hashlib.sha256(parsed.query.encode()).hexdigest()[:8]
+    return job_id.replace("..", "_")
+
+
+def iter_manifest(manifest_path):
+    """Jobs from a JSONL manifest; relative paths resolve against its folder"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+                if not isinstance(job, dict):
+                    raise ValueError("entry is not a JSON object")
+                if "path" in job:
+                    job["path"] = os.path.join(base, job["path"])
+                elif "url" not in job:
+                    raise ValueError("entry needs a path or url")
+                job["id"] = check_job_id(job.get("id") or default_job_id(job, base))
+            except ValueError as e:
+                # Recorded as a failed job so the rest of the manifest still runs
+                yield {"id": f"{os.path.basename(manifest_path)}:{line_number}", "error": str(e)}
+                continue
+            yield job
+
+
+def render_settings(options):
+    """Settings that change rendered pixels without changing output paths"""
+    return json.dumps([options["crop_mode"], list(options["background"]), options["quality"]])
+
+
+def planned_outputs(job, options):
+    """"platform/variant" outputs a job should produce, in render order"""
+    from imageapp import FILTER_CONFIGS
+
+    variants = ["enhanced"] if options["enhance"] else []
+    for name in job.get("filters") or options["filters"]:
+        if name in FILTER_CONFIGS and name not in variants:
+            variants.append(name)
+    return [f"{platform}/{variant}" for platform in job.get("platforms") or options["platforms"]
+            for variant in variants]
+
+
+def load_checkpoint(path, settings):
+    """
+    Outputs already written by earlier runs with the same render settings
+
+    Returns:
+        Dict of id -> set of "platform/variant"
+    """
+    done = {}
+    if not path or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Torn last line from an interrupted run
+            if entry.get("settings") == settings:
+                done.setdefault(entry["id"], set()).update(entry.get("outputs", ()))
+    return done
+
+
+def init_worker(options):
+    global worker_options
+    worker_options = options
+    # Workers only render; keep the parent in charge of Ctrl-C
+    import signal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def render_job(job):
+    """
+    Decode one image and write the variants in job["outputs"]
+
+    Returns:
+        Checkpoint entry for the job, listing the outputs written
+    """
+    from PIL import Image
+    import imageapp
+
+    options = worker_options
+    start = time.perf_counter()
+    if "error" in job:
+        return {"id": job["id"], "status": "error", "error": job["error"]}
+    settings = render_settings(options)
+    written = []
+    try:
+        if "path" in job:
+            image = Image.open(job["path"])
+        else:
+            image = imageapp.bytes_to_image(imageapp.fetcher.fetch(job["url"]))
+            if image is None:
+                raise ValueError("could not decode downloaded image")
+        if imageapp.check_image_size(image) is None:
+            raise ValueError(f"image exceeds {imageapp.MAX_IMAGE_PIXELS} pixels")
+        image.load()
+
+        by_platform = {}
+        for output in job["outputs"]:
+            platform, variant = output.split("/")
+            by_platform.setdefault(platform, []).append(variant)
+        for platform, variants in by_platform.items():
+            target_size = imageapp.PLATFORM_SIZES[platform]
+            folder = os.path.join(options["output"], job["id"], platform)
+            os.makedirs(folder, exist_ok=True)
+            for variant, _, rendered in imageapp.render_variants(
+                image, target_size, [v for v in variants if v != "enhanced"],
+                "enhanced" in variants, options["crop_mode"], options["background"]
+            ):
+                rendered.save(os.path.join(folder, f"{variant}.jpg"), format="JPEG",
+                              quality=options["quality"], optimize=True)
+                del rendered
+                written.append(f"{platform}/{variant}")
+
+        return {"id": job["id"], "status": "ok", "variants": len(written), "outputs": written,
+                "settings": settings, "seconds": round(time.perf_counter() - start, 3)}
+    except Exception as e:
+        # Outputs written before the failure still count on the next run
+        return {"id": job["id"], "status": "error", "error": str(e), "outputs": written, "settings": settings}
+
+
+def run(jobs, options, workers, checkpoint_path=None, progress_every=25):
+    """
+    Render jobs on a worker pool, appending results to the checkpoint
+
+    Returns:
+        Summary dict with counts and throughput
+    """
+    done = load_checkpoint(checkpoint_path, render_settings(options))
+    skipped = 0
+
+    def pending():
+        nonlocal skipped
+        for job in jobs:
+            if "error" not in job:
+                finished = done.get(job["id"], ())
+                job["outputs"] = [output for output in planned_outputs(job, options) if output not in finished]
+                if not job["outputs"]:
+                    skipped += 1
+                    continue
+            yield job
+
+    rendered = failed = variants = 0
+    start = time.perf_counter()
+    checkpoint = open(checkpoint_path, "a") if checkpoint_path else None
+    pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(options,))
+    try:
+        for result in pool.imap_unordered(render_job, pending()):
+            if result["status"] == "ok":
+                rendered += 1
+                variants += result["variants"]
+            else:
+                failed += 1
+                print(f"  failed {result['id']}: {result['error']}", file=sys.stderr)
+            if checkpoint:
+                checkpoint.write(json.dumps(result) + "\n")
+                checkpoint.flush()
+
+            processed = rendered + failed
+            if progress_every and processed % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  {processed} images, {processed / elapsed:.2f} images/sec")
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        print("Interrupted; rerun with the same checkpoint to resume", file=sys.stderr)
+    except BaseException:
+        # join() on a running pool would replace the real error
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if checkpoint:
+            checkpoint.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rendered": rendered,
+        "failed": failed,
+        "skipped": skipped,
+        "variants": variants,
+        "seconds": elapsed,
+        "images_per_sec": (rendered + failed) / elapsed if elapsed else 0.0
+    }
+
+
+def main():
+    from imageapp import FILTER_CONFIGS, PLATFORM_SIZES, parse_background
+
+    parser = argparse.ArgumentParser(description="Render image variants in bulk without the HTTP server")
+    parser.add_argument("input", help="Directory of images or JSONL manifest")
+    parser.add_argument("--output", required=True, help="Directory for rendered variants")
+    parser.add_argument("--platforms", default="instagram_post", help="Comma-separated platform names")
+    parser.add_argument("--filters", default="enhanced,vibrant,professional", help="Comma-separated filter names")
+    parser.add_argument("--no-enhance", action="store_true", help="Skip the auto-enhanced variant")
+    parser.add_argument("--crop-mode", default="center", help="center, top, bottom, left or right")
+    parser.add_argument("--background", help="Colour behind transparent pixels (default: white)")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>/checkpoint.jsonl)")
+    parser.add_argument("--progress-every", type=int, default=25, help="Report throughput every N images")
+    args = parser.parse_args()
+
+    platforms = args.platforms.split(",")
+    filters = args.filters.split(",")
+    unknown = [p for p in platforms if p not in PLATFORM_SIZES] + \
+              [f for f in filters if f != "enhanced" and f not in FILTER_CONFIGS]
+    if unknown:
+        parser.error(f"unknown platform or filter: {', '.join(unknown)}")
+
+    if os.path.isdir(args.input):
+        jobs = iter_directory(args.input)
+    elif os.path.isfile(args.input):
+        jobs = iter_manifest(args.input)
+    else:
+        parser.error(f"{args.input} is neither a directory nor a manifest file")
+
+    os.makedirs(args.output, exist_ok=True)
+    options = {
+        "output": args.output,
+        "platforms": platforms,
+        "filters": filters,
+        "enhance": not args.no_enhance,
+        "crop_mode": args.crop_mode,
+        "background": parse_background(args.background),
+        "quality": args.quality
+    }
+    checkpoint = args.checkpoint or os.path.join(args.output, "checkpoint.jsonl")
+
+    print(f"Rendering {args.input} -> {args.output} with {args.workers} worker(s)")
+    summary = run(jobs, options, args.workers, checkpoint, args.progress_every)
+    print(f"Rendered {summary['rendered']} images ({summary['variants']} variants), "
+          f"{summary['failed']} failed, {summary['skipped']} skipped from checkpoint "
+          f"in {summary['seconds']:.1f}s: {summary['images_per_sec']:.2f} images/sec")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
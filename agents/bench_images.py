@@ -0,0 +1,292 @@
+"""
+Benchmark suite for the image agent hot paths.
+
+Runs every processing function on synthetic images at several resolutions and
+PIL modes and reports latency, throughput (megapixels/sec) and peak memory per
+stage. Results can be written to JSON and compared against an earlier run.
+
+Usage:
+    python bench_images.py [--sizes 1,12,48] [--modes RGB,RGBA,P,L] [--repeat 3] [--png]
+                           [--output run.json] [--compare baseline.json]
+"""
+import io
+import os
+import sys
+import json
+import gc
+import time
+import ctypes
+import argparse
+import platform
+import threading
+import subprocess
+import tracemalloc
+from statistics import median
+
+import numpy as np
+import cv2
+import PIL
+from PIL import Image
+
+from imageapp import (
+    FILTER_CONFIGS, PLATFORM_SIZES, apply_filter, apply_sepia, enhance_image_quality,
+    image_to_base64, optimize_for_web, smart_crop_and_resize
+)
+
+MB = 1024 * 1024
+
+try:
+    _libc = ctypes.CDLL("libc.so.6")
+except OSError:
+    _libc = None
+
+
+def release_free_memory():
+    """Return freed heap pages to the OS so RSS deltas reflect the next stage"""
+    gc.collect()
+    if _libc is not None and hasattr(_libc, "malloc_trim"):
+        _libc.malloc_trim(0)
+
+
+def current_rss():
+    """Resident set size in bytes, or None when /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemory:
+    """
+    Track peak memory growth while the block runs.
+
+    Samples RSS from a background thread on Linux; elsewhere falls back to
+    tracemalloc, which only sees Python and NumPy allocations.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            rss = current_rss()
+            if rss and rss > self._peak:
+                self._peak = rss
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        release_free_memory()
+        self._baseline = current_rss()
+        if self._baseline is None:
+            tracemalloc.start()
+        else:
+            self._peak = self._baseline
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._baseline is None:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            self._stop.set()
+            self._thread.join()
+            self.peak_bytes = max(self._peak, current_rss() or 0) - self._baseline
+        return False
+
+
+def synthetic_image(megapixels, mode, seed=0):
+    """
+    Build a deterministic 4:3 test image with gradients, edges and noise
+
+    Args:
+        megapixels: Approximate size in megapixels
+        mode: PIL mode (RGB, RGBA, P, L, LA, I;16, CMYK, ...)
+        seed: RNG seed
+
+    Returns:
+        PIL Image
+    """
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    rng = np.random.default_rng(seed)
+
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = (x * 0.7 + y * 0.3).astype(np.uint8)
+    rgb[..., 1] = (255 - x * 0.5 - y * 0.2).astype(np.uint8)
+    rgb[..., 2] = ((x + y) * 0.5).astype(np.uint8)
+    rgb[height // 3: height // 3 + height // 10, :, :] //= 2  # Hard edge band
+    rgb += rng.integers(0, 16, size=(height, width, 1), dtype=np.uint8)
+
+    image = Image.fromarray(rgb, "RGB")
+    if mode in ("RGBA", "LA"):
+        alpha = np.tile(np.linspace(64, 255, width, dtype=np.uint8), (height, 1))
+        image.putalpha(Image.fromarray(alpha, "L"))
+        if mode == "LA":
+            image = image.convert("LA")
+    elif mode == "I;16":
+        image = Image.fromarray(np.asarray(image.convert("L"), dtype=np.uint16) * 257)
+    elif mode == "P":
+        image = image.quantize(colors=256)
+    elif mode != "RGB":
+        image = image.convert(mode)
+    return image
+
+
+def time_stage(fn, repeat):
+    """Run fn `repeat` times, returning (timings, peak_bytes, last_result)"""
+    timings = []
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        result = None
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        peak = max(peak, memory.peak_bytes)
+    return timings, peak, result
+
+
+def build_stages(target_size):
+    """Ordered list of (stage name, function taking the normalized RGB image)"""
+    stages = [("enhance_image_quality", enhance_image_quality)]
+    for name in FILTER_CONFIGS:
+        stages.append((f"apply_filter:{name}", lambda image, name=name: apply_filter(image, name)))
+    stages.append(("apply_sepia", apply_sepia))
+    stages.append(("smart_crop_and_resize", lambda image: smart_crop_and_resize(image, target_size)))
+    return stages
+
+
+def decode_png(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def run_suite(sizes, modes, repeat, platform_name, png=False):
+    target_size = PLATFORM_SIZES[platform_name]
+    results = []
+
+    for megapixels in sizes:
+        for mode in modes:
+            source = synthetic_image(megapixels, mode)
+            source.load()
+            pixels = source.width * source.height
+
+            def record(stage_name, timings, peak, stage_pixels):
+                entry = {
+                    "megapixels": megapixels,
+                    "width": source.width,
+                    "height": source.height,
+                    "mode": mode,
+                    "stage": stage_name,
+                    "median_ms": median(timings) * 1000,
+                    "min_ms": min(timings) * 1000,
+                    "mpix_per_s": stage_pixels / 1e6 / median(timings),
+                    "peak_mem_mb": peak / MB
+                }
+                results.append(entry)
+                print(f"{megapixels:>5}MP {mode:<5}{stage_name:<32}{entry['median_ms']:>10.1f} ms"
+                      f"{entry['mpix_per_s']:>10.1f} MP/s{entry['peak_mem_mb']:>10.1f} MB")
+
+            timings, peak, rgb = time_stage(lambda: optimize_for_web(source), repeat)
+            record("optimize_for_web", timings, peak, pixels)
+
+            if png and mode != "CMYK":
+                buffer = io.BytesIO()
+                source.save(buffer, format="PNG", compress_level=1)
+                data = buffer.getvalue()
+                timings, peak, _ = time_stage(lambda: optimize_for_web(decode_png(data)), repeat)
+                record("png_decode+optimize_for_web", timings, peak, pixels)
+                del buffer, data
+
+            for stage_name, fn in build_stages(target_size):
+                timings, peak, _ = time_stage(lambda: fn(rgb), repeat)
+                record(stage_name, timings, peak, pixels)
+
+            resized = smart_crop_and_resize(rgb, target_size)
+            out_pixels = target_size[0] * target_size[1]
+            timings, peak, _ = time_stage(lambda: image_to_base64(resized), repeat)
+            record("image_to_base64", timings, peak, out_pixels)
+
+            timings, peak, _ = time_stage(lambda: image_to_base64(rgb), repeat)
+            record("image_to_base64:full", timings, peak, pixels)
+
+            del source, rgb, resized
+
+    return results
+
+
+def environment_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+
+
+def compare(results, baseline_path):
+    """Print median latency ratios against an earlier JSON run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["megapixels"], r["mode"], r["stage"])
+    previous = {key(r): r for r in baseline["results"]}
+
+    print(f"\nComparison against {baseline_path} (commit {baseline['environment'].get('commit')})")
+    print(f"{'case':<50}{'before ms':>12}{'after ms':>12}{'ratio':>8}")
+    for entry in results:
+        before = previous.get(key(entry))
+        if not before:
+            continue
+        ratio = entry["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        case = f"{entry['megapixels']}MP {entry['mode']} {entry['stage']}"
+        print(f"{case:<50}{before['median_ms']:>12.1f}{entry['median_ms']:>12.1f}{ratio:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image agent benchmark suite")
+    parser.add_argument("--sizes", default="1,12,48", help="Comma-separated megapixel sizes")
+    parser.add_argument("--modes", default="RGB,RGBA,P,L", help="Comma-separated PIL modes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage (median is reported)")
+    parser.add_argument("--png", action="store_true", help="Also time PNG decode + normalization per mode")
+    parser.add_argument("--platform", default="instagram_post", choices=list(PLATFORM_SIZES))
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare against an earlier JSON run")
+    args = parser.parse_args()
+
+    sizes = [float(s) if "." in s else int(s) for s in args.sizes.split(",")]
+    modes = args.modes.split(",")
+
+    print(f"{'size':>7} {'mode':<5}{'stage':<32}{'latency':>13}{'throughput':>15}{'peak mem':>13}")
+    results = run_suite(sizes, modes, args.repeat, args.platform, args.png)
+
+    report = {"environment": environment_info(), "config": vars(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
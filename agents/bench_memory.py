@@ -0,0 +1,90 @@
+"""
+Peak-memory benchmark for /process-images as the number of images grows.
+
+Each case runs in a fresh subprocess: it builds the request body, then posts it
+through the Flask test client and drains the streamed response chunk by chunk.
+Peak RSS growth is measured from just before the request, so the client's own
+copy of the payload is excluded.
+
+Usage:
+    python bench_memory.py [--counts 1,5,10,20] [--megapixels 4] [--transport json,multipart]
+"""
+import io
+import sys
+import json
+import base64
+import argparse
+import subprocess
+
+MB = 1024 * 1024
+
+
+def run_child(count, megapixels, transport):
+    from bench_images import PeakMemory, synthetic_image
+    import imageapp
+
+    image = synthetic_image(megapixels, "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    jpeg = buffer.getvalue()
+    del image, buffer
+
+    filters = ["enhanced", "vibrant", "professional", "bold"]
+    client = imageapp.app.test_client()
+    if transport == "multipart":
+        kwargs = {"data": {"images": [(io.BytesIO(jpeg), f"{i}.jpg") for i in range(count)], "filters": filters}}
+        payload_bytes = len(jpeg) * count
+    else:
+        encoded = base64.b64encode(jpeg).decode()
+        body = json.dumps({"images": [encoded] * count, "filters": filters}).encode()
+        kwargs = {"data": body, "content_type": "application/json"}
+        payload_bytes = len(body)
+        del encoded
+
+    response_bytes = 0
+    with PeakMemory() as memory:
+        response = client.post("/process-images", buffered=False, **kwargs)
+        for chunk in response.response:
+            response_bytes += len(chunk)
+        response.close()
+
+    print(json.dumps({
+        "count": count,
+        "transport": transport,
+        "status": response.status_code,
+        "payload_mb": payload_bytes / MB,
+        "response_mb": response_bytes / MB,
+        "peak_rss_mb": memory.peak_bytes / MB
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/process-images peak memory vs image count")
+    parser.add_argument("--counts", default="1,5,10,20", help="Comma-separated image counts")
+    parser.add_argument("--megapixels", type=float, default=4, help="Size of each source image")
+    parser.add_argument("--transport", default="json,multipart", help="json and/or multipart")
+    parser.add_argument("--child", nargs=2, metavar=("COUNT", "TRANSPORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(int(args.child[0]), args.megapixels, args.child[1])
+        return
+
+    print(f"{'transport':<12}{'images':>8}{'payload MB':>12}{'response MB':>13}{'peak RSS MB':>13}")
+    for transport in args.transport.split(","):
+        for count in [int(c) for c in args.counts.split(",")]:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--megapixels", str(args.megapixels), "--child", str(count), transport],
+                capture_output=True, text=True
+            )
+            lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+            if proc.returncode != 0 or not lines:
+                print(f"{transport:<12}{count:>8}  failed: {proc.stderr.strip()[-200:]}")
+                continue
+            result = json.loads(lines[-1])
+            print(f"{transport:<12}{count:>8}{result['payload_mb']:>12.1f}{result['response_mb']:>13.1f}"
+                  f"{result['peak_rss_mb']:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
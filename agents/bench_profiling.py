@@ -0,0 +1,93 @@
+"""
+Overhead benchmark for the opt-in request profiler.
+
+Times the same small Flask app under four setups:
+- off: profiling not configured (no hooks installed)
+- armed: token configured, but requests don't ask for a profile
+- sampled: sample rate 1%
+- profiled: every request profiled via the X-Profile header
+
+Each setup is timed on a trivial JSON endpoint and on a ~1 ms CPU-bound one.
+Latency is the median per-request time over several batches through the
+Flask test client.
+
+Usage:
+    python bench_profiling.py [--requests 2000] [--batches 5]
+"""
+import time
+import argparse
+import tempfile
+from statistics import median
+
+from flask import Flask, jsonify
+
+from instrumentation import init_app as init_instrumentation
+from profiling import PROFILE_HEADER, init_app as init_profiling
+
+TOKEN = "bench-token"
+
+
+def build_app(profile_dir, **profiling):
+    app = Flask(__name__)
+    init_instrumentation(app, "bench")
+    init_profiling(app, "bench", directory=profile_dir, keep=20, **profiling)
+
+    @app.route("/ping")
+    def ping():
+        return jsonify({"ok": True})
+
+    @app.route("/work")
+    def work():
+        total = 0
+        for i in range(20000):
+            total += i * i % 7
+        return jsonify({"total": total})
+
+    return app
+
+
+def time_requests(app, path, count, batches, headers=None):
+    """Median per-request latency in microseconds"""
+    client = app.test_client()
+    # Close each response like a WSGI server would; profiles are saved on close
+    for _ in range(50):
+        client.get(path, headers=headers).close()
+    results = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        for _ in range(count):
+            client.get(path, headers=headers).close()
+        results.append((time.perf_counter() - start) / count * 1e6)
+    return median(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request profiler overhead")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per batch")
+    parser.add_argument("--batches", type=int, default=5, help="Batches per case (median is reported)")
+    args = parser.parse_args()
+
+    profile_dir = tempfile.mkdtemp(prefix="bench-profiles-")
+    setups = [
+        ("off", build_app(profile_dir, token="", sample_rate=0), None),
+        ("armed", build_app(profile_dir, token=TOKEN, sample_rate=0), None),
+        ("sampled 1%", build_app(profile_dir, token="", sample_rate=0.01), None),
+        ("profiled", build_app(profile_dir, token=TOKEN, sample_rate=0), {PROFILE_HEADER: TOKEN})
+    ]
+    off_app = setups[0][1]
+    print(f"before_request hooks when off: {len(off_app.before_request_funcs.get(None, []))} "
+          f"(instrumentation only)\n")
+
+    print(f"{'setup':<14}{'endpoint':<10}{'us/request':>12}{'vs off':>10}")
+    for path in ("/ping", "/work"):
+        baseline = None
+        for name, app, headers in setups:
+            # The profiled case writes a file per request, so fewer are enough
+            count = args.requests if headers is None else max(args.requests // 10, 50)
+            latency = time_requests(app, path, count, args.batches, headers)
+            baseline = baseline or latency
+            print(f"{name:<14}{path:<10}{latency:>12.1f}{latency / baseline:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Requests/sec benchmark: Flask dev server vs. the gunicorn launcher in serve.py.
+
+Starts each server as a subprocess, hammers one endpoint from a client thread
+pool for a fixed duration and prints the throughput.
+
+Usage:
+    python bench_server.py [--agent music] [--path /moods] [--duration 10] [--concurrency 16]
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_until_healthy(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).ok:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def hammer(url, duration, concurrency):
+    """Send GET requests from `concurrency` threads for `duration` seconds"""
+    def worker():
+        session = requests.Session()
+        ok = errors = 0
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            try:
+                if session.get(url, timeout=10).ok:
+                    ok += 1
+                else:
+                    errors += 1
+            except requests.exceptions.RequestException:
+                errors += 1
+        return ok, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: worker(), range(concurrency)))
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def run_case(label, extra_args, args):
+    cmd = [sys.executable, os.path.join(HERE, "serve.py"), args.agent, "--port", str(args.port)] + extra_args
+    proc = subprocess.Popen(cmd, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        if not wait_until_healthy(base + "/health"):
+            print(f"{label}: server did not become healthy")
+            return None
+        hammer(base + args.path, 1, args.concurrency)  # warm-up
+        ok, errors = hammer(base + args.path, args.duration, args.concurrency)
+        rps = ok / args.duration
+        print(f"{label:<32}{rps:>12.1f}{errors:>10}")
+        return rps
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dev server vs gunicorn throughput")
+    parser.add_argument("--agent", default="music", help="Agent to serve (see serve.py)")
+    parser.add_argument("--path", default="/moods", help="Endpoint to request")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'server':<32}{'req/s':>12}{'errors':>10}")
+    dev = run_case("flask dev server (threaded)", ["--dev"], args)
+    prod = run_case(f"gunicorn {args.workers}w x {args.threads}t",
+                    ["--workers", str(args.workers), "--threads", str(args.threads)], args)
+    if dev and prod:
+        print(f"speedup: {prod / dev:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
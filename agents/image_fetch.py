@@ -0,0 +1,252 @@
+"""
+Pooled image downloads for the image agent.
+
+Fetches image URLs in parallel over a shared connection pool, limits
+concurrency per host, revalidates cached copies with ETag/Last-Modified and
+keeps response bodies in a bounded on-disk cache.
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class FetchError(Exception):
+    """Raised when an image URL cannot be fetched"""
+
+
+def is_url(value):
+    return isinstance(value, str) and value.startswith(("http://", "https://", "file://"))
+
+
+class ImageFetcher:
+    """
+    Parallel, cached image downloader
+
+    Args:
+        cache_dir: Directory for cached bodies (None disables the cache)
+        max_workers: Download threads shared by all requests
+        per_host: Concurrent downloads allowed per host
+        timeout: Per-request timeout in seconds
+        max_bytes: Largest body accepted
+        cache_max_bytes: Cache size above which the oldest entries are pruned
+        allow_file_urls: Accept file:// URLs (local testing only)
+        lookahead: Downloads per fetch_many call that may run or wait ahead of
+            the consumer; each can hold up to max_bytes
+        session: requests.Session to use (a pooled one is created if omitted)
+    """
+
+    def __init__(self, cache_dir=None, max_workers=8, per_host=4, timeout=30, max_bytes=64 * 1024 * 1024,
+                 cache_max_bytes=1024 * 1024 * 1024, allow_file_urls=False, lookahead=2, session=None):
+        self.cache_dir = cache_dir
+        self.lookahead = lookahead
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.allow_file_urls = allow_file_urls
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-fetch")
+        self.host_limits = {}
+        self.lock = threading.Lock()
+        self.writes_since_prune = 0
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(max_workers, per_host))
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _host_limit(self, host):
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_limits[host]
+
+    def _cache_paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        folder = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(folder, key + ".body"), os.path.join(folder, key + ".json")
+
+    def _read_cache(self, url):
+        if not self.cache_dir:
+            return None, None
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if not os.path.exists(body_path):
+                return None, None
+            return body_path, meta
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_cache(self, url, content, headers):
+        if not self.cache_dir:
+            return
+        body_path, meta_path = self._cache_paths(url)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "lastModified": headers.get("Last-Modified"),
+            "size": len(content),
+            "storedAt": time.time()
+        }
+        try:
+            # Write to temp files and rename so readers never see partial entries
+            for path, data, mode in ((body_path, content, "wb"), (meta_path, json.dumps(meta), "w")):
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, mode) as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Image cache write error: {e}")
+            return
+
+        with self.lock:
+            self.writes_since_prune += 1
+            should_prune = self.writes_since_prune >= 50
+            if should_prune:
+                self.writes_since_prune = 0
+        if should_prune:
+            self.prune_cache()
+
+    def prune_cache(self):
+        """Delete the least recently used cache entries above cache_max_bytes"""
+        if not self.cache_dir:
+            return
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".body"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            for stale in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+
+    def _read_file_url(self, url):
+        if not self.allow_file_urls:
+            raise FetchError("file:// URLs are disabled")
+        path = url2pathname(urlparse(url).path)
+        if os.path.getsize(path) > self.max_bytes:
+            raise FetchError(f"{url} exceeds {self.max_bytes} bytes")
+        with open(path, "rb") as f:
+            return f.read()
+
+    def fetch(self, url):
+        """
+        Download one URL, revalidating any cached copy
+
+        Args:
+            url: http(s) or (if enabled) file URL
+
+        Returns:
+            Response body bytes
+        """
+        parsed = urlparse(url)
+        if parsed.scheme == "file":
+            return self._read_file_url(url)
+        if parsed.scheme not in ("http", "https"):
+            raise FetchError(f"Unsupported URL scheme: {parsed.scheme!r}")
+
+        body_path, meta = self._read_cache(url)
+        headers = {}
+        if meta:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified"):
+                headers["If-Modified-Since"] = meta["lastModified"]
+
+        with self._host_limit(parsed.netloc):
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+            except requests.exceptions.RequestException as e:
+                raise FetchError(f"{url}: {e}") from e
+
+            with response:
+                if response.status_code == 304 and body_path:
+                    os.utime(body_path)
+                    with open(body_path, "rb") as f:
+                        return f.read()
+                if response.status_code != 200:
+                    raise FetchError(f"{url}: HTTP {response.status_code}")
+
+                length = response.headers.get("Content-Length")
+                if length and length.isdigit() and int(length) > self.max_bytes:
+                    raise FetchError(f"{url} exceeds {self.max_bytes} bytes")
+                chunks = []
+                received = 0
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise FetchError(f"{url} exceeds {self.max_bytes} bytes")
+                    chunks.append(chunk)
+                content = b"".join(chunks)
+
+        if response.headers.get("ETag") or response.headers.get("Last-Modified"):
+            self._write_cache(url, content, response.headers)
+        return content
+
+    def _fetch_or_error(self, url):
+        try:
+            return self.fetch(url)
+        except Exception as e:
+            return e if isinstance(e, FetchError) else FetchError(f"{url}: {e}")
+
+    def fetch_many(self, urls, window=None):
+        """
+        Download URLs in parallel, yielding results in input order
+
+        At most `window` downloads are in flight or buffered ahead of the
+        consumer, so one call holds at most `window` undecoded bodies of up
+        to max_bytes each. Downloads start as soon as this is called.
+
+        Args:
+            urls: List of URLs
+            window: Look-ahead (defaults to self.lookahead)
+
+        Returns:
+            Iterator of bytes, or FetchError for failed URLs
+        """
+        window = max(1, window or self.lookahead)
+        pending = iter(urls)
+        futures = []
+        for url in pending:
+            futures.append(self.executor.submit(self._fetch_or_error, url))
+            if len(futures) >= window:
+                break
+
+        def results():
+            while futures:
+                result = futures.pop(0).result()
+                next_url = next(pending, None)
+                if next_url is not None:
+                    futures.append(self.executor.submit(self._fetch_or_error, next_url))
+                yield result
+
+        return results()
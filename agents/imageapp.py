@@ -1,16 +1,59 @@
 import os
 import io
+import json
 import base64
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from werkzeug.exceptions import RequestEntityTooLarge
+from PIL import Image, ImageColor, ImageEnhance, ImageFilter, ImageOps
 import numpy as np
 import cv2
+import tempfile
+
+from image_fetch import FetchError, ImageFetcher, is_url
+from instrumentation import init_app as init_instrumentation, stage
+from profiling import init_app as init_profiling
+from shared_images import (
+    SharedImage, SharedImageMissing, SharedImageRegistry, content_key, find_image, image_exists, is_handle,
+    new_handle, publish_array, release_image, segment_size, shm_free_bytes
+)
 
 print("Starting Image Processing Agent...")
 
 app = Flask(__name__)
 CORS(app)
+init_instrumentation(app, "image-processing-agent")
+init_profiling(app, "image-processing-agent")
+
+# Admission limits for /process-images
+MAX_REQUEST_BYTES = int(os.getenv("IMAGE_AGENT_MAX_REQUEST_MB", "64")) * 1024 * 1024
+MAX_IMAGES_PER_REQUEST = int(os.getenv("IMAGE_AGENT_MAX_IMAGES", "20"))
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_AGENT_MAX_PIXELS", str(50_000_000)))
+
+# Co-located mode: decoded images staged in shared memory by /images/stage.
+# The byte cap covers every staged image on the host; staging also stops while
+# /dev/shm has less than the headroom free. Images the caller never released
+# are reclaimed once the lease has passed.
+SHARED_IMAGE_CAPACITY_BYTES = int(os.getenv("IMAGE_AGENT_SHARED_MB", "512")) * 1024 * 1024
+SHARED_MEMORY_HEADROOM_BYTES = int(os.getenv("IMAGE_AGENT_SHM_HEADROOM_MB", "16")) * 1024 * 1024
+SHARED_IMAGE_LEASE_SECONDS = int(os.getenv("IMAGE_AGENT_SHARED_LEASE_SECONDS", "3600"))
+shared_registry = SharedImageRegistry(SHARED_IMAGE_CAPACITY_BYTES, SHARED_IMAGE_LEASE_SECONDS)
+
+# Image URLs are downloaded here rather than relayed through the backend
+fetcher = ImageFetcher(
+    cache_dir=os.getenv("IMAGE_AGENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "image-agent-cache")) or None,
+    max_workers=int(os.getenv("IMAGE_AGENT_FETCH_WORKERS", "8")),
+    per_host=int(os.getenv("IMAGE_AGENT_FETCH_PER_HOST", "4")),
+    timeout=float(os.getenv("IMAGE_AGENT_FETCH_TIMEOUT", "30")),
+    max_bytes=MAX_REQUEST_BYTES,
+    cache_max_bytes=int(os.getenv("IMAGE_AGENT_CACHE_MB", "1024")) * 1024 * 1024,
+    allow_file_urls=os.getenv("IMAGE_AGENT_ALLOW_FILE_URLS", "false").lower() == "true",
+    # Bodies fetched ahead of decoding, per request; each can be MAX_REQUEST_BYTES
+    lookahead=int(os.getenv("IMAGE_AGENT_FETCH_LOOKAHEAD", "2"))
+)
+
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
 
 # Platform-specific image dimensions
 PLATFORM_SIZES = {
@@ -24,6 +67,9 @@ PLATFORM_SIZES = {
     "youtube_thumbnail": (1280, 720)
 }
 
+# Colour behind transparent pixels when flattening to RGB
+BACKGROUND_COLOR = ImageColor.getrgb(os.getenv("IMAGE_AGENT_BACKGROUND", "#ffffff"))[:3]
+
 # Filter presets
 FILTER_CONFIGS = {
     "vibrant": {"color": 1.5, "contrast": 1.2, "brightness": 1.05, "sharpness": 1.2},
@@ -172,20 +218,92 @@ def smart_crop_and_resize(image, target_size, crop_mode="center"):
         print(f"Crop/resize error: {e}")
         return image.resize(target_size, Image.LANCZOS)
 
-def optimize_for_web(image, quality=85):
+def flatten_alpha(image, background=BACKGROUND_COLOR):
+    """
+    Composite an RGBA or LA image over a solid background in one pass
+    
+    Uses the alpha band directly as the paste mask instead of splitting
+    every band.
+    
+    Args:
+        image: PIL Image in RGBA or LA mode
+        background: RGB tuple
+    
+    Returns:
+        PIL Image in RGB mode
+    """
+    flattened = Image.new('RGB', image.size, background)
+    color = image if image.mode == 'RGBA' else image.convert('RGB')
+    flattened.paste(color, mask=image.getchannel('A'))
+    return flattened
+
+def high_bit_depth_to_uint8(array, sixteen_bit=False):
+    """Scale a 16/32-bit integer or float pixel array down to uint8"""
+    if array.dtype.kind == 'f':
+        peak = float(np.nanmax(array)) if array.size else 0.0
+        scale = 255.0 if peak <= 1.0 else 1.0
+        return np.clip(np.nan_to_num(array) * scale, 0, 255).astype(np.uint8)
+    
+    # 32-bit 'I' images may hold 8-bit or 16-bit ranges
+    if sixteen_bit or (array.size and array.max() > 255):
+        return (np.clip(array, 0, 65535) >> 8).astype(np.uint8)
+    return np.clip(array, 0, 255).astype(np.uint8)
+
+def normalize_image(image, background=BACKGROUND_COLOR):
+    """
+    Bring any decoded image into upright 8-bit RGB in a single stage
+    
+    Applies the EXIF orientation, converts every PIL mode (palette, grayscale,
+    16-bit, float, CMYK, ...) to RGB and flattens transparency onto
+    `background` in a single composite.
+    
+    Args:
+        image: PIL Image object
+        background: RGB tuple used behind transparent pixels
+    
+    Returns:
+        PIL Image in RGB mode
+    """
+    # EXIF orientation (exif_transpose copies even when nothing changes)
+    if image.getexif().get(0x0112, 1) != 1:
+        image = ImageOps.exif_transpose(image)
+    
+    mode = image.mode
+    if mode == 'RGB':
+        return image
+    
+    if mode in ('P', 'PA'):
+        has_alpha = mode == 'PA' or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        mode = image.mode
+        if mode == 'RGB':
+            return image
+    elif mode in ('RGBa', 'La'):
+        image = image.convert(mode.upper())
+        mode = image.mode
+    
+    if mode in ('RGBA', 'LA'):
+        return flatten_alpha(image, background)
+    
+    if mode.startswith('I') or mode == 'F':
+        gray = high_bit_depth_to_uint8(np.asarray(image), sixteen_bit=mode.startswith('I;16'))
+        return Image.fromarray(gray, 'L').convert('RGB')
+    
+    if mode == 'CMYK' and image.info.get('icc_profile'):
+        try:
+            from PIL import ImageCms
+            source_profile = ImageCms.ImageCmsProfile(io.BytesIO(image.info['icc_profile']))
+            return ImageCms.profileToProfile(image, source_profile, ImageCms.createProfile('sRGB'), outputMode='RGB')
+        except Exception as e:
+            print(f"ICC conversion error: {e}")
+    
+    # L, 1, CMYK, YCbCr, LAB, HSV
+    return image.convert('RGB')
+
+def optimize_for_web(image, quality=85, background=BACKGROUND_COLOR):
     """Optimize image for web delivery"""
     try:
-        # Convert to RGB if needed
-        if image.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        return image
+        return normalize_image(image, background)
     except Exception as e:
         print(f"Optimization error: {e}")
         return image
@@ -208,11 +326,52 @@ def base64_to_image(base64_string):
             base64_string = base64_string.split(',')[1]
         
         img_data = base64.b64decode(base64_string)
-        return Image.open(io.BytesIO(img_data))
+        return check_image_size(Image.open(io.BytesIO(img_data)))
     except Exception as e:
         print(f"Base64 decode error: {e}")
         return None
 
+def bytes_to_image(data):
+    """Open downloaded image bytes as a PIL Image"""
+    try:
+        if isinstance(data, FetchError):
+            raise data
+        return check_image_size(Image.open(io.BytesIO(data)))
+    except Exception as e:
+        print(f"Fetched image error: {e}")
+        return None
+
+def file_to_image(stream):
+    """Open an uploaded multipart file stream as a PIL Image"""
+    try:
+        return check_image_size(Image.open(stream))
+    except Exception as e:
+        print(f"Upload decode error: {e}")
+        return None
+
+def shared_handle_to_image(handle):
+    """
+    Read a staged image out of shared memory as a PIL Image
+    
+    Raises:
+        SharedImageMissing: The handle was released; the caller must resend the image
+    """
+    try:
+        with SharedImage(handle) as shared:
+            return Image.fromarray(shared.array, 'RGB')
+    except SharedImageMissing:
+        raise
+    except Exception as e:
+        print(f"Shared image error ({handle}): {e}")
+        return None
+
+def check_image_size(image):
+    """Reject images above MAX_IMAGE_PIXELS before their pixels are decoded"""
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        print(f"Image too large: {image.width}x{image.height} exceeds {MAX_IMAGE_PIXELS} pixels")
+        return None
+    return image
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -221,116 +380,400 @@ def health_check():
         "service": "image-processing-agent"
     }), 200
 
+def render_variants(image, target_size, requested_filters, auto_enhance, crop_mode,
+                    background=BACKGROUND_COLOR):
+    """
+    Yield every requested variant of one decoded image, cropped and resized
+    
+    Variants are produced one at a time so callers can encode or write each
+    before the next full-size intermediate is created.
+    
+    Yields:
+        Tuples of (variant key, display name, PIL Image at target_size)
+    """
+    # Upright RGB with transparency flattened onto the background
+    with stage("normalize"):
+        image = normalize_image(image, background)
+    
+    # Enhanced version (original with auto-enhancement)
+    if auto_enhance:
+        with stage("enhance"):
+            enhanced = enhance_image_quality(image)
+        with stage("crop_resize"):
+            enhanced = smart_crop_and_resize(enhanced, target_size, crop_mode)
+        yield "enhanced", "Enhanced Original", enhanced
+        del enhanced
+    
+    # Apply requested filters
+    for filter_name in requested_filters:
+        if filter_name == "enhanced":
+            continue  # Already added
+        
+        if filter_name in FILTER_CONFIGS:
+            with stage("filter"):
+                filtered = apply_filter(image, filter_name)
+            with stage("crop_resize"):
+                filtered = smart_crop_and_resize(filtered, target_size, crop_mode)
+            yield filter_name, filter_name.replace('_', ' ').title(), filtered
+            del filtered
+
+def process_single_image(idx, image, platform, target_size, requested_filters, auto_enhance, crop_mode,
+                         background=BACKGROUND_COLOR):
+    """
+    Render every variant of one decoded image as base64 data URLs
+    
+    Returns:
+        Processed image dict, or None if processing failed
+    """
+    try:
+        variants = []
+        for variant, name, rendered in render_variants(
+            image, target_size, requested_filters, auto_enhance, crop_mode, background
+        ):
+            with stage("encode"):
+                encoded = image_to_base64(rendered)
+            del rendered
+            
+            if encoded:
+                variants.append({
+                    "variant": variant,
+                    "name": name,
+                    "url": f"data:image/jpeg;base64,{encoded}",
+                    "width": target_size[0],
+                    "height": target_size[1]
+                })
+        
+        return {
+            "id": idx,
+            "platform": platform,
+            "dimensions": {"width": target_size[0], "height": target_size[1]},
+            "variants": variants,
+            "variantCount": len(variants)
+        }
+    
+    except Exception as e:
+        print(f"Error processing image {idx}: {e}")
+        return None
+
+def read_process_request():
+    """
+    Read /process-images options and image sources from JSON or multipart
+    
+    JSON bodies carry base64 strings or URLs in `images`, URLs in `imageUrls`
+    or shared-memory handles from /images/stage in `handles` (only one of the
+    three). URLs are downloaded in parallel as soon as the request is read.
+    Multipart bodies carry files in `images` (spooled to disk by werkzeug)
+    and options as form fields.
+    
+    Returns:
+        Tuple of (sources, fetch function or None, decode function, options dict);
+        fetch turns a source into what decode takes
+    
+    Raises:
+        ValueError: More than one image field was sent
+    """
+    if request.files:
+        form = request.form
+        # Take ownership of the spooled upload streams: Flask closes request
+        # files when the view returns, before the streamed response is built
+        sources = []
+        for file_storage in request.files.getlist('images'):
+            sources.append(file_storage.stream)
+            file_storage.stream = None
+        options = {
+            "platform": form.get('platform', 'instagram_post'),
+            "filters": form.getlist('filters') or ['enhanced', 'vibrant', 'professional'],
+            "enhance": form.get('enhance', 'true').lower() != 'false',
+            "cropMode": form.get('cropMode', 'center'),
+            "background": form.get('background')
+        }
+        return sources, None, file_to_image, options
+    
+    # Don't cache the raw body or the parsed JSON on the request object
+    data = request.get_json(cache=False) or {}
+    fields = {name: data.pop(name) for name in ('handles', 'images', 'imageUrls') if data.get(name)}
+    if len(fields) > 1:
+        raise ValueError(f"Send only one of {', '.join(sorted(fields))}")
+    handles = fields.get('handles')
+    sources = handles or fields.get('images') or fields.get('imageUrls') or []
+    fetch = None
+    decode = shared_handle_to_image if handles else base64_to_image
+    
+    urls = [source for source in sources if is_url(source)] if not handles else []
+    if urls and len(sources) <= MAX_IMAGES_PER_REQUEST:
+        # Downloads run ahead of decoding; results come back in request order
+        downloads = fetcher.fetch_many(urls)
+        
+        def fetch(source):
+            return next(downloads) if is_url(source) else source
+        
+        def decode(source):
+            if isinstance(source, str):
+                return base64_to_image(source)
+            return bytes_to_image(source)
+    options = {
+        "platform": data.get('platform', 'instagram_post'),
+        "filters": data.get('filters', ['enhanced', 'vibrant', 'professional']),
+        "enhance": data.get('enhance', True),
+        "cropMode": data.get('cropMode', 'center'),
+        "background": data.get('background')
+    }
+    return sources, fetch, decode, options
+
+def parse_background(value):
+    """Parse a CSS colour ("#fff", "white", "rgb(0,0,0)") into an RGB tuple"""
+    if not value:
+        return BACKGROUND_COLOR
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except (ValueError, AttributeError):
+        print(f"Invalid background colour: {value}")
+        return BACKGROUND_COLOR
+
+@app.errorhandler(413)
+def request_too_large(error):
+    """Reject bodies larger than MAX_CONTENT_LENGTH"""
+    return jsonify({
+        "success": False,
+        "error": f"Request body exceeds {MAX_REQUEST_BYTES // (1024 * 1024)} MB"
+    }), 413
+
 @app.route('/process-images', methods=['POST'])
 def process_images():
     """
     Main endpoint for image processing
     
-    Request Body:
-        - images: List of base64 encoded images or URLs
+    Request Body (JSON, or multipart with the same field names):
+        - images: List of base64 encoded images or image URLs (or uploaded files)
+        - imageUrls: List of image URLs, fetched by the agent (instead of images)
+        - handles: List of shared-memory handles from /images/stage (instead of images)
         - platform: Target platform (default: instagram_post)
         - filters: List of filter names to apply
         - enhance: Boolean to apply auto-enhancement
         - cropMode: "center", "top", "bottom"
+        - background: Colour behind transparent pixels (default: white)
+    
+    Limits: MAX_REQUEST_BYTES per body, MAX_IMAGES_PER_REQUEST images and
+    MAX_IMAGE_PIXELS pixels per image (larger images are skipped).
     
     Returns:
-        JSON with processed images
+        JSON with processed images, streamed one image at a time
     """
     try:
-        data = request.json or {}
+        try:
+            sources, fetch, decode, options = read_process_request()
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        images_data = data.get('images', [])
-        platform = data.get('platform', 'instagram_post')
-        requested_filters = data.get('filters', ['enhanced', 'vibrant', 'professional'])
-        auto_enhance = data.get('enhance', True)
-        crop_mode = data.get('cropMode', 'center')
+        platform = options['platform']
+        requested_filters = options['filters']
+        auto_enhance = options['enhance']
+        crop_mode = options['cropMode']
+        background = parse_background(options['background'])
         
-        if not images_data:
+        if not sources:
             return jsonify({
                 "success": False,
                 "error": "No images provided"
             }), 400
         
+        if len(sources) > MAX_IMAGES_PER_REQUEST:
+            return jsonify({
+                "success": False,
+                "error": f"Too many images: {len(sources)} (max {MAX_IMAGES_PER_REQUEST})"
+            }), 413
+        
         if platform not in PLATFORM_SIZES:
             platform = 'instagram_post'
         
         target_size = PLATFORM_SIZES[platform]
-        processed_images = []
         
-        for idx, img_data in enumerate(images_data):
+        if decode is shared_handle_to_image:
+            missing = [handle for handle in sources if not image_exists(handle)]
+            if missing:
+                # Gone or never staged here: the caller resends the images instead
+                return jsonify({
+                    "success": False,
+                    "error": "Shared images are not available",
+                    "missingHandles": missing
+                }), 410
+        
+        def generate():
+            # The 200 status goes out with the first chunk, so the outcome is
+            # reported at the end of the body: "success" is written last and the
+            # JSON is always closed, even if processing fails part way
+            target = {"width": target_size[0], "height": target_size[1]}
+            yield f'{{"platform": {json.dumps(platform)}, "targetSize": {json.dumps(target)}, "processedImages": ['
+            
+            count = 0
+            error = None
+            missing = []
             try:
-                # Decode image
-                image = base64_to_image(img_data)
-                if not image:
-                    continue
-                
-                # Convert to RGB and optimize
-                image = optimize_for_web(image)
-                
-                # Create variants
-                variants = []
-                
-                # Enhanced version (original with auto-enhancement)
-                if auto_enhance:
-                    enhanced = enhance_image_quality(image.copy())
-                    enhanced = smart_crop_and_resize(enhanced, target_size, crop_mode)
-                    enhanced_b64 = image_to_base64(enhanced)
-                    
-                    if enhanced_b64:
-                        variants.append({
-                            "variant": "enhanced",
-                            "name": "Enhanced Original",
-                            "url": f"data:image/jpeg;base64,{enhanced_b64}",
-                            "width": target_size[0],
-                            "height": target_size[1]
-                        })
-                
-                # Apply requested filters
-                for filter_name in requested_filters:
-                    if filter_name == "enhanced":
-                        continue  # Already added
+                for idx in range(len(sources)):
+                    # Drop our reference to the source as soon as it is decoded
+                    source, sources[idx] = sources[idx], None
+                    image = None
+                    try:
+                        if fetch:
+                            # Waiting on a download is timed apart from decoding
+                            with stage("fetch"):
+                                source = fetch(source)
+                        with stage("decode"):
+                            image = decode(source)
+                            if image:
+                                image.load()
+                        if not image:
+                            continue
+                        processed = process_single_image(
+                            idx, image, platform, target_size, requested_filters, auto_enhance, crop_mode, background
+                        )
+                    except SharedImageMissing:
+                        raise
+                    except Exception as e:
+                        print(f"Skipping image {idx}: {e}")
+                        continue
+                    finally:
+                        if hasattr(source, 'close'):
+                            source.close()
+                        del source, image
                     
-                    if filter_name in FILTER_CONFIGS:
-                        filtered = apply_filter(image.copy(), filter_name)
-                        filtered = smart_crop_and_resize(filtered, target_size, crop_mode)
-                        filtered_b64 = image_to_base64(filtered)
-                        
-                        if filtered_b64:
-                            variants.append({
-                                "variant": filter_name,
-                                "name": filter_name.replace('_', ' ').title(),
-                                "url": f"data:image/jpeg;base64,{filtered_b64}",
-                                "width": target_size[0],
-                                "height": target_size[1]
-                            })
-                
-                processed_images.append({
-                    "id": idx,
-                    "platform": platform,
-                    "dimensions": {"width": target_size[0], "height": target_size[1]},
-                    "variants": variants,
-                    "variantCount": len(variants)
-                })
-                
+                    if processed:
+                        yield (', ' if count else '') + json.dumps(processed)
+                        count += 1
             except Exception as e:
-                print(f"Error processing image {idx}: {e}")
-                continue
+                print(f"Process images stream error: {e}")
+                error = f"Failed to process images: {e}"
+                if isinstance(e, SharedImageMissing):
+                    missing.append(e.handle)
+            
+            if error is None:
+                yield f'], "count": {count}, "success": true}}'
+            else:
+                yield (f'], "count": {count}, "success": false, "error": {json.dumps(error)}, '
+                       f'"missingHandles": {json.dumps(missing)}}}')
+        
+        return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+    
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        print(f"Process images error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Failed to process images: {str(e)}"
+        }), 500
+
+@app.route('/images/stage', methods=['POST'])
+def stage_image():
+    """
+    Fetch and decode an image once into shared memory for co-located agents
+    
+    Request Body (JSON, or multipart with an `image` file):
+        - url: Image URL to download
+        - image: Base64 encoded image (instead of url)
+        - background: Colour behind transparent pixels (default: white)
+    
+    Each call publishes its own copy under a new handle, which the caller
+    owns until it releases it with DELETE /images/<handle>. Content that is
+    already staged is copied from the existing pixels instead of decoded.
+    
+    Returns:
+        JSON with the handle and image size
+    """
+    try:
+        if 'image' in request.files:
+            image_bytes = request.files['image'].read()
+            background = request.form.get('background')
+        else:
+            data = request.get_json(cache=False) or {}
+            background = data.get('background')
+            if data.get('url'):
+                with stage("fetch"):
+                    image_bytes = fetcher.fetch(data['url'])
+            elif data.get('image'):
+                encoded = data['image']
+                image_bytes = base64.b64decode(encoded.split(',')[1] if ',' in encoded else encoded)
+            else:
+                return jsonify({
+                    "success": False,
+                    "error": "url or image is required"
+                }), 400
+        
+        # Pixels depend on the flattening colour as well as the source bytes
+        background = parse_background(background)
+        key = content_key(image_bytes + bytes(background))
+        handle = new_handle(key)
+        try:
+            # Already staged by someone else: copy their decoded pixels
+            existing = find_image(key)
+            if existing is None:
+                raise SharedImageMissing(key)
+            shared = SharedImage(existing)
+            pixels = shared.array
+        except SharedImageMissing:
+            shared = None
+            with stage("decode"):
+                image = check_image_size(Image.open(io.BytesIO(image_bytes)))
+                if image is None:
+                    return jsonify({
+                        "success": False,
+                        "error": f"Image exceeds {MAX_IMAGE_PIXELS} pixels"
+                    }), 413
+                image = normalize_image(image, background)
+                pixels = np.asarray(image)
+            del image
+        del image_bytes
+        
+        try:
+            size = segment_size(pixels)
+            if not shared_registry.reserve(size):
+                raise OSError("staged images would exceed IMAGE_AGENT_SHARED_MB")
+            free = shm_free_bytes()
+            if free is not None and free < size + SHARED_MEMORY_HEADROOM_BYTES:
+                raise OSError(f"only {free} bytes free in shared memory")
+            publish_array(handle, pixels)
+        except OSError as e:
+            # The caller falls back to sending the image itself
+            print(f"Stage image skipped ({size} bytes): {e}")
+            return jsonify({
+                "success": False,
+                "error": "Not enough shared memory to stage this image"
+            }), 507
+        finally:
+            height, width = pixels.shape[:2]
+            del pixels
+            if shared is not None:
+                shared.close()
         
         return jsonify({
             "success": True,
-            "platform": platform,
-            "targetSize": {"width": target_size[0], "height": target_size[1]},
-            "processedImages": processed_images,
-            "count": len(processed_images)
+            "handle": handle,
+            "width": width,
+            "height": height
         }), 200
     
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
-        print(f"Process images error: {str(e)}")
+        print(f"Stage image error: {str(e)}")
         return jsonify({
             "success": False,
-            "error": f"Failed to process images: {str(e)}"
+            "error": f"Failed to stage image: {str(e)}"
         }), 500
 
+@app.route('/images/<handle>', methods=['DELETE'])
+def release_staged_image(handle):
+    """Release a staged image once every agent is done with it"""
+    if not is_handle(handle):
+        return jsonify({"success": False, "error": "Invalid handle"}), 400
+    return jsonify({
+        "success": True,
+        "released": release_image(handle)
+    }), 200
+
 @app.route('/platforms', methods=['GET'])
 def get_platforms():
     """Get list of available platforms and their sizes"""
@@ -0,0 +1,285 @@
+"""
+Shared latency instrumentation for the agents.
+
+Stages are timed with the `stage` context manager and recorded as histograms;
+`init_app` adds request timing, request id propagation and a Prometheus-style
+/metrics endpoint to a Flask app.
+
+Metrics are collected per process. With AGENT_METRICS_DIR set (serve.py sets
+it for gunicorn), every process also writes its series to a file there and
+/metrics adds up the files of all workers, so a scrape that lands on any
+worker reports the whole server.
+
+Environment:
+    AGENT_METRICS_DIR: Directory shared by the worker processes of one server
+    AGENT_METRICS_FLUSH_SECONDS: How often a worker writes its file (default 1)
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import tempfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, has_app_context, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, totals = self.series.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0, 0]))
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def dump(self):
+        return [[list(labels), counts, totals] for labels, (counts, totals) in self.series.items()]
+
+    def merge(self, dumped):
+        for labels, counts, (total, count) in dumped:
+            own_counts, own_totals = self.series.setdefault(
+                tuple(labels), ([0] * (len(self.buckets) + 1), [0.0, 0]))
+            for index, bucket_count in enumerate(counts):
+                own_counts[index] += bucket_count
+            own_totals[0] += total
+            own_totals[1] += count
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, (total, count)) in sorted(self.series.items()):
+            label_text = format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+
+    def inc(self, labels, amount=1):
+        self.series[labels] = self.series.get(labels, 0) + amount
+
+    def dump(self):
+        return [[list(labels), value] for labels, value in self.series.items()]
+
+    def merge(self, dumped):
+        for labels, value in dumped:
+            self.inc(tuple(labels), value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def format_labels(names, values):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return ",".join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe holder for all agent metrics
+
+    Args:
+        directory: Shared directory for multi-process servers (None: this process only)
+        flush_interval: Seconds between writes of this process's file
+    """
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self.flusher_pid = None
+        self.lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "agent_stage_seconds", "Time spent in a named processing stage", ("service", "stage"))
+        self.stage_errors = Counter(
+            "agent_stage_errors_total", "Stages that raised an exception", ("service", "stage"))
+        self.request_seconds = Histogram(
+            "agent_request_seconds", "End-to-end request latency", ("service", "endpoint", "method", "status"))
+        self.requests_total = Counter(
+            "agent_requests_total", "Requests handled", ("service", "endpoint", "method", "status"))
+
+    def metrics(self):
+        return (self.stage_seconds, self.stage_errors, self.request_seconds, self.requests_total)
+
+    def _changed(self):
+        # Called with the lock held. Workers are forked after import, so the
+        # flush thread is started by the first observation in each process
+        self.dirty = True
+        if self.directory and self.flusher_pid != os.getpid():
+            self.flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def observe_stage(self, service, name, seconds, failed=False):
+        with self.lock:
+            self.stage_seconds.observe((service, name), seconds)
+            if failed:
+                self.stage_errors.inc((service, name))
+            self._changed()
+
+    def observe_request(self, labels, seconds):
+        with self.lock:
+            self.request_seconds.observe(labels, seconds)
+            self.requests_total.inc(labels)
+            self._changed()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush error: {e}")
+
+    def flush(self):
+        """Write this process's series to the shared directory"""
+        with self.lock:
+            if not (self.directory and self.dirty):
+                return
+            text = json.dumps({metric.name: metric.dump() for metric in self.metrics()})
+            self.dirty = False
+        # Rename into place so a scrape never reads a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".metrics-")
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, os.path.join(self.directory, f"metrics-{os.getpid()}.json"))
+
+    def _render_local(self):
+        with self.lock:
+            lines = []
+            for metric in self.metrics():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def render(self):
+        """Exposition text for this process, or for every worker when a directory is set"""
+        if not self.directory:
+            return self._render_local()
+        self.flush()
+        # Files of exited workers are kept, so counters never go backwards
+        merged = MetricsRegistry()
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("metrics-") and name.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric in merged.metrics():
+                metric.merge(data.get(metric.name, []))
+        return merged._render_local()
+
+
+def reset_metrics_dir(directory):
+    """
+    Create a multi-process metrics directory and clear an earlier run's files
+
+    Only call this before any worker of the server has started.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith(("metrics-", ".metrics-")):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+registry = MetricsRegistry(
+    os.getenv("AGENT_METRICS_DIR") or None, float(os.getenv("AGENT_METRICS_FLUSH_SECONDS", "1")))
+
+
+def current_service():
+    """Service name of the active Flask app, if any"""
+    if has_app_context():
+        return g.get("service", "unknown")
+    return "offline"
+
+
+def current_request_id():
+    """Request id of the active request, if any"""
+    if has_app_context():
+        return g.get("request_id")
+    return None
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a named processing stage
+
+    Args:
+        name: Stage name (decode, enhance, filter, crop_resize, encode, ...)
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        registry.observe_stage(current_service(), name, time.perf_counter() - start, failed)
+
+
+def init_app(app, service):
+    """
+    Add request timing, request id propagation and /metrics to a Flask app
+
+    Args:
+        app: Flask application
+        service: Service label used in every metric series
+    """
+    @app.before_request
+    def start_request_timer():
+        g.service = service
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.get("request_start")
+        if start is not None and request.endpoint != "metrics":
+            labels = (service, request.endpoint or "unknown", request.method, str(response.status_code))
+            # Recorded on close so streamed responses are timed to their last byte
+            response.call_on_close(lambda: registry.observe_request(labels, time.perf_counter() - start))
+        if g.get("request_id"):
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+    @app.route("/metrics", methods=["GET"], endpoint="metrics")
+    def metrics():
+        """Prometheus text exposition of the agent metrics"""
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -1,16 +1,40 @@
 import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
 
+from instrumentation import init_app as init_instrumentation, stage
+from profiling import init_app as init_profiling
+
 print("Starting Music Suggestion Agent...")
 
 app = Flask(__name__)
 CORS(app)
+init_instrumentation(app, "music-suggestion-agent")
+init_profiling(app, "music-suggestion-agent")
 
 # iTunes API Configuration
 ITUNES_BASE_URL = 'https://itunes.apple.com/search'
 
+# Overall time budget (seconds) for the concurrent query variants
+SEARCH_DEADLINE = float(os.getenv("MUSIC_SEARCH_DEADLINE", "5"))
+
+# Fan-out searches allowed at once per process. Each holds one worker thread
+# per query variant until all of its queries finish, even past the deadline,
+# so the pool always has room for every admitted search.
+MAX_CONCURRENT_SEARCHES = int(os.getenv("MUSIC_SEARCH_CONCURRENCY", "4"))
+MAX_QUERY_VARIANTS = 5
+
+# Shared connection pool and worker threads for the fan-out search
+_search_slots = threading.BoundedSemaphore(MAX_CONCURRENT_SEARCHES)
+_search_workers = MAX_CONCURRENT_SEARCHES * MAX_QUERY_VARIANTS
+_search_session = requests.Session()
+_search_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=_search_workers))
+_search_executor = ThreadPoolExecutor(max_workers=_search_workers, thread_name_prefix="itunes-search")
+
 # Mood to Genre Mapping
 MOOD_GENRES = {
     "happy": "Pop",
@@ -27,6 +51,22 @@ MOOD_GENRES = {
     "inspiring": "Classical"
 }
 
+# Neighbouring moods used as extra search variants
+RELATED_MOODS = {
+    "happy": ["upbeat", "party"],
+    "energetic": ["workout", "party"],
+    "calm": ["relaxing", "chill"],
+    "romantic": ["calm", "happy"],
+    "upbeat": ["happy", "energetic"],
+    "relaxing": ["calm", "chill"],
+    "motivational": ["inspiring", "workout"],
+    "sad": ["calm", "romantic"],
+    "party": ["energetic", "happy"],
+    "workout": ["energetic", "motivational"],
+    "chill": ["relaxing", "calm"],
+    "inspiring": ["motivational", "calm"]
+}
+
 # Mood Keywords for Detection
 MOOD_KEYWORDS = {
     "happy": ["happy", "joy", "fun", "cheerful", "excited", "amazing", "wonderful"],
@@ -67,13 +107,59 @@ def analyze_mood(description, caption=""):
     
     return "upbeat"
 
-def search_itunes(mood, limit=5):
+def format_track(track, mood, genre):
+    """Convert an iTunes result into a suggestion dict"""
+    return {
+        "title": track.get('trackName', 'Unknown'),
+        "artist": track.get('artistName', 'Unknown'),
+        "album": track.get('collectionName', 'Unknown'),
+        "mood": mood,
+        "genre": track.get('primaryGenreName', genre),
+        "previewUrl": track.get('previewUrl'),
+        "artwork": track.get('artworkUrl100', '').replace('100x100', '300x300'),
+        "releaseDate": track.get('releaseDate', '').split('T')[0] if track.get('releaseDate') else None,
+        "trackTime": track.get('trackTimeMillis', 0) // 1000,  # Convert to seconds
+        "iTunesUrl": track.get('trackViewUrl'),
+        "instagramAudioId": None  # For future integration
+    }
+
+def fetch_itunes_results(term, limit, timeout=10, session=None):
     """
-    Search music using iTunes API
+    Run one iTunes search query
+    
+    Args:
+        term: Search term
+        limit: Number of raw results to request
+        timeout: Request timeout in seconds
+        session: Optional requests.Session to reuse connections
+    
+    Returns:
+        List of raw iTunes result dicts
+    """
+    params = {
+        'term': term,
+        'media': 'music',
+        'entity': 'song',
+        'limit': limit,
+        'explicit': 'No',
+        'country': 'US'
+    }
+    
+    response = (session or requests).get(ITUNES_BASE_URL, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json().get('results') or []
+
+def search_itunes(mood, limit=5, timeout=10, session=None):
+    """
+    Search music using iTunes API with the primary query only
+    
+    Used when every fan-out slot is busy.
     
     Args:
         mood: Detected mood
         limit: Number of results to return
+        timeout: Request timeout in seconds
+        session: Optional requests.Session to reuse connections
     
     Returns:
         List of music suggestions
@@ -81,44 +167,20 @@ def search_itunes(mood, limit=5):
     try:
         genre = MOOD_GENRES.get(mood, "Pop")
         
-        # Search parameters
-        params = {
-            'term': f'{mood} music {genre}',
-            'media': 'music',
-            'entity': 'song',
-            'limit': limit * 2,  # Get more to filter explicit content
-            'explicit': 'No',
-            'country': 'US'
-        }
-        
-        response = requests.get(ITUNES_BASE_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        # Get more to filter explicit content
+        results = fetch_itunes_results(f'{mood} music {genre}', limit * 2, timeout, session)
         
         suggestions = []
         
-        if 'results' in data and data['results']:
-            for track in data['results']:
-                # Skip explicit content
-                if track.get('trackExplicitness') == 'explicit':
-                    continue
-                
-                suggestions.append({
-                    "title": track.get('trackName', 'Unknown'),
-                    "artist": track.get('artistName', 'Unknown'),
-                    "album": track.get('collectionName', 'Unknown'),
-                    "mood": mood,
-                    "genre": track.get('primaryGenreName', genre),
-                    "previewUrl": track.get('previewUrl'),
-                    "artwork": track.get('artworkUrl100', '').replace('100x100', '300x300'),
-                    "releaseDate": track.get('releaseDate', '').split('T')[0] if track.get('releaseDate') else None,
-                    "trackTime": track.get('trackTimeMillis', 0) // 1000,  # Convert to seconds
-                    "iTunesUrl": track.get('trackViewUrl'),
-                    "instagramAudioId": None  # For future integration
-                })
-                
-                if len(suggestions) >= limit:
-                    break
+        for track in results:
+            # Skip explicit content
+            if track.get('trackExplicitness') == 'explicit':
+                continue
+            
+            suggestions.append(format_track(track, mood, genre))
+            
+            if len(suggestions) >= limit:
+                break
         
         return suggestions
     
@@ -129,6 +191,111 @@ def search_itunes(mood, limit=5):
         print(f"Search error: {e}")
         return []
 
+def build_query_variants(mood):
+    """
+    Build the weighted list of search terms for a mood
+    
+    Args:
+        mood: Detected mood
+    
+    Returns:
+        List of (term, weight) tuples, most specific first
+    """
+    genre = MOOD_GENRES.get(mood, "Pop")
+    variants = [(f'{mood} music {genre}', 1.0), (f'{mood} music', 0.8), (f'{genre} hits', 0.6)]
+    variants += [(f'{related} music', 0.4) for related in RELATED_MOODS.get(mood, [])]
+    
+    seen = set()
+    unique = []
+    for term, weight in variants:
+        if term not in seen:
+            seen.add(term)
+            unique.append((term, weight))
+    return unique[:MAX_QUERY_VARIANTS]
+
+async def search_itunes_fanout(mood, limit=5, deadline=SEARCH_DEADLINE):
+    """
+    Search music with several query variants concurrently
+    
+    All variants share one deadline. Results are merged and deduped by track id
+    and ranked by weighted reciprocal rank across variants. The search returns
+    early only once the primary mood+genre query has finished and `limit`
+    clean tracks have been collected, so the ranking always sees it.
+    
+    When MAX_CONCURRENT_SEARCHES fan-outs are already running (including
+    queries still finishing after their deadline), only the primary query is
+    run, in the calling thread, instead of queueing behind them.
+    
+    Args:
+        mood: Detected mood
+        limit: Number of results to return
+        deadline: Overall time budget in seconds
+    
+    Returns:
+        List of music suggestions
+    """
+    if not _search_slots.acquire(blocking=False):
+        print("Music search busy; running the primary query only")
+        return search_itunes(mood, limit, timeout=deadline, session=_search_session)
+    
+    genre = MOOD_GENRES.get(mood, "Pop")
+    variants = build_query_variants(mood)
+    
+    # Give the slot back once every query thread is free again
+    futures = []
+    pending = [len(variants)]
+    pending_lock = threading.Lock()
+    
+    def query_finished(_):
+        with pending_lock:
+            pending[0] -= 1
+            if pending[0] == 0:
+                _search_slots.release()
+    
+    for term, _ in variants:
+        future = _search_executor.submit(fetch_itunes_results, term, limit * 2, deadline, _search_session)
+        future.add_done_callback(query_finished)
+        futures.append(future)
+    
+    async def run_query(index, future):
+        try:
+            return index, await asyncio.wrap_future(future)
+        except Exception as e:
+            print(f"iTunes API error ({variants[index][0]}): {e}")
+            return index, []
+    
+    tasks = [asyncio.ensure_future(run_query(index, future)) for index, future in enumerate(futures)]
+    scores = {}
+    tracks = {}
+    primary_done = False
+    
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=deadline):
+            index, results = await next_done
+            weight = variants[index][1]
+            primary_done = primary_done or index == 0
+            
+            for position, track in enumerate(results):
+                # Skip explicit content
+                if track.get('trackExplicitness') == 'explicit':
+                    continue
+                
+                track_id = track.get('trackId') or (track.get('trackName'), track.get('artistName'))
+                scores[track_id] = scores.get(track_id, 0.0) + weight / (position + 1)
+                if track_id not in tracks:
+                    tracks[track_id] = format_track(track, mood, genre)
+            
+            if primary_done and len(tracks) >= limit:
+                break
+    except asyncio.TimeoutError:
+        print(f"Music search deadline reached with {len(tracks)} tracks")
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    ranked = sorted(tracks, key=lambda track_id: scores[track_id], reverse=True)
+    return [tracks[track_id] for track_id in ranked[:limit]]
+
 def get_fallback_suggestions(mood, limit=5):
     """
     Provide fallback suggestions when API fails
@@ -207,12 +374,14 @@ def suggest_music():
         if mood_override and mood_override.lower() in MOOD_GENRES:
             mood = mood_override.lower()
         else:
-            mood = analyze_mood(description, caption)
+            with stage("mood_detection"):
+                mood = analyze_mood(description, caption)
         
         print(f"Detected mood: {mood}")
         
         # Search for music
-        suggestions = search_itunes(mood, limit=limit)
+        with stage("upstream_search"):
+            suggestions = asyncio.run(search_itunes_fanout(mood, limit=limit))
         
         # Use fallback if no results
         if not suggestions:
@@ -6,7 +6,10 @@ from dotenv import load_dotenv
 from PIL import Image
 from io import BytesIO
 
+from instrumentation import init_app as init_instrumentation, stage
+from profiling import init_app as init_profiling
 from optimizer import InstagramCaptionOptimizer
+from shared_images import SharedImage, SharedImageMissing
 
 print("Starting Flask app...")
 
@@ -15,6 +18,8 @@ load_dotenv()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for backend communication
+init_instrumentation(app, "caption-optimizer")
+init_profiling(app, "caption-optimizer")
 
 # Load Gemini API key
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -34,13 +39,18 @@ def optimize_instagram():
     image_path = None
     
     try:
-        if "image" not in request.files:
+        image_handle = request.form.get("imageHandle")
+        if "image" not in request.files and not image_handle:
             return jsonify({"success": False, "error": "Image file is required"}), 400
 
         intent = request.form.get("intent")
         if not intent:
             return jsonify({"success": False, "error": "Intent is required"}), 400
 
+        # Co-located mode: image already decoded into shared memory by the image agent
+        if image_handle:
+            return optimize_shared_image(image_handle, intent)
+
         image_file = request.files["image"]
 
         # Create temp file
@@ -49,16 +59,17 @@ def optimize_instagram():
             
         # Process image properly
         try:
-            # Read the file stream
-            image_bytes = image_file.read()
-            img = Image.open(BytesIO(image_bytes))
-            
-            # Convert to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Save as JPEG
-            img.save(image_path, 'JPEG', quality=95)
+            with stage("decode"):
+                # Read the file stream
+                image_bytes = image_file.read()
+                img = Image.open(BytesIO(image_bytes))
+                
+                # Convert to RGB if needed
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                
+                # Save as JPEG
+                img.save(image_path, 'JPEG', quality=95)
             
         except Exception as e:
             if image_path and os.path.exists(image_path):
@@ -104,6 +115,40 @@ def optimize_instagram():
                 pass
 
 
+def optimize_shared_image(image_handle, intent):
+    """Generate a caption for an image staged in shared memory"""
+    try:
+        with stage("decode"):
+            with SharedImage(image_handle) as shared:
+                img = Image.fromarray(shared.array, "RGB")
+    except SharedImageMissing as e:
+        # Released or never staged here: the caller resends the image instead
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "missingHandles": [image_handle]
+        }), 410
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"Invalid image handle: {str(e)}"
+        }), 400
+
+    try:
+        result = optimizer.optimize_image(img, intent)
+        return jsonify({
+            "success": True,
+            "caption": result["caption"],
+            "hashtags": result.get("hashtags", [])
+        }), 200
+    except Exception as e:
+        print(f"Optimization error: {str(e)}")
+        return jsonify({
+            "success": False,
+            "error": f"Optimization failed: {str(e)}"
+        }), 500
+
+
 if __name__ == "__main__":
     print(f"Caption Optimizer Agent running on http://0.0.0.0:5000")
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -2,6 +2,8 @@ import google.generativeai as genai
 from PIL import Image
 import re
 
+from instrumentation import stage
+
 
 class InstagramCaptionOptimizer:
     def __init__(self, gemini_api_key):
@@ -43,15 +45,36 @@ class InstagramCaptionOptimizer:
         try:
             # Open and validate image
             try:
-                img = Image.open(image_path)
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                fixed_path = image_path.rsplit('.', 1)[0] + '_fixed.jpg'
-                img.save(fixed_path, 'JPEG', quality=95)
-                img_to_use = Image.open(fixed_path)
+                with stage("prepare_image"):
+                    img = Image.open(image_path)
+                    if img.mode != 'RGB':
+                        img = img.convert('RGB')
+                    fixed_path = image_path.rsplit('.', 1)[0] + '_fixed.jpg'
+                    img.save(fixed_path, 'JPEG', quality=95)
+                    img_to_use = Image.open(fixed_path)
             except Exception as e:
                 raise Exception(f"Image processing failed: {str(e)}")
 
+            return self.optimize_image(img_to_use, intent)
+
+        except Exception as e:
+            # Last resort: return fallback caption
+            print(f"Error in optimize: {str(e)}")
+            result = self._parse_fallback(self._generate_fallback_caption(intent))
+            return result
+
+    def optimize_image(self, img, intent):
+        """
+        Optimize caption for an already decoded image
+
+        Args:
+            img: RGB PIL Image
+            intent: User's intended message/context
+
+        Returns:
+            dict with 'caption' and 'hashtags'
+        """
+        try:
             # Create prompt
             prompt = f"""
 Analyze this image and create an engaging Instagram caption based on the following intent:
@@ -71,8 +94,9 @@ HASHTAGS: [comma-separated hashtags without #]
             # Generate content with image
             if self.model:
                 try:
-                    response = self.model.generate_content([prompt, img_to_use])
-                    response_text = response.text
+                    with stage("model_call"):
+                        response = self.model.generate_content([prompt, img])
+                        response_text = response.text
                 except Exception as e:
                     error_str = str(e)
                     print(f"⚠️  Model generation failed: {error_str[:100]}")
@@ -86,25 +110,26 @@ HASHTAGS: [comma-separated hashtags without #]
                 response_text = self._generate_fallback_caption(intent)
 
             # Parse response
-            caption = ""
-            hashtags = []
-
-            # Extract caption
-            caption_match = re.search(r'CAPTION:\s*(.+?)(?=HASHTAGS:|$)', response_text, re.DOTALL | re.IGNORECASE)
-            if caption_match:
-                caption = caption_match.group(1).strip()
-
-            # Extract hashtags
-            hashtags_match = re.search(r'HASHTAGS:\s*(.+?)$', response_text, re.DOTALL | re.IGNORECASE)
-            if hashtags_match:
-                hashtag_text = hashtags_match.group(1).strip()
-                hashtags = [tag.strip().lstrip('#') for tag in hashtag_text.split(',')]
-                hashtags = [f"#{tag}" for tag in hashtags if tag]
-
-            # Fallback if parsing fails
-            if not caption:
-                caption = response_text.strip()
-                hashtags = re.findall(r'#\w+', response_text)
+            with stage("parse"):
+                caption = ""
+                hashtags = []
+
+                # Extract caption
+                caption_match = re.search(r'CAPTION:\s*(.+?)(?=HASHTAGS:|$)', response_text, re.DOTALL | re.IGNORECASE)
+                if caption_match:
+                    caption = caption_match.group(1).strip()
+
+                # Extract hashtags
+                hashtags_match = re.search(r'HASHTAGS:\s*(.+?)$', response_text, re.DOTALL | re.IGNORECASE)
+                if hashtags_match:
+                    hashtag_text = hashtags_match.group(1).strip()
+                    hashtags = [tag.strip().lstrip('#') for tag in hashtag_text.split(',')]
+                    hashtags = [f"#{tag}" for tag in hashtags if tag]
+
+                # Fallback if parsing fails
+                if not caption:
+                    caption = response_text.strip()
+                    hashtags = re.findall(r'#\w+', response_text)
 
             return {
                 "caption": caption,
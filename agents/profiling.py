@@ -0,0 +1,215 @@
+"""
+Opt-in per-request profiling for the agents.
+
+A request is profiled with cProfile when it carries the X-Profile header with
+the configured token, or when it is picked by the sample rate. Each profile is
+written as a pstats file to an on-disk ring buffer that /debug/profiles lists
+and serves. When neither a token nor a sample rate is configured no hooks are
+installed at all, so profiling costs nothing unless it is switched on.
+
+Environment:
+    AGENT_PROFILE_TOKEN: Secret for the X-Profile header and /debug/profiles
+    AGENT_PROFILE_SAMPLE_RATE: Fraction of requests profiled (default 0)
+    AGENT_PROFILE_DIR: Ring buffer directory (default <tmp>/agent-profiles)
+    AGENT_PROFILE_KEEP: Profiles kept per service (default 50)
+"""
+import io
+import os
+import re
+import hmac
+import json
+import time
+import random
+import pstats
+import cProfile
+import itertools
+import tempfile
+import threading
+
+from flask import Response, abort, g, jsonify, request, send_file
+
+from instrumentation import current_request_id
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.prof$")
+
+# cProfile instances can't run concurrently in one process, and under the
+# threaded server only the profiled request's own thread is traced anyway
+_profiler_lock = threading.Lock()
+
+
+class ProfileStore:
+    """Bounded directory of pstats files with a JSON summary beside each"""
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self.sequence = itertools.count()
+        os.makedirs(directory, exist_ok=True)
+
+    def new_name(self, request_id):
+        # Request ids repeat (the backend reuses the draft id), so the
+        # millisecond timestamp, pid and a per-process counter keep names unique
+        now_ms = time.time_ns() // 1_000_000
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now_ms // 1000)) + f"{now_ms % 1000:03d}"
+        name = f"{stamp}-{os.getpid()}-{next(self.sequence)}-{(request_id or 'request')[:64]}.prof"
+        return re.sub(r"[^\w.-]", "_", name)
+
+    def _names_by_age(self):
+        """Stored profile names, oldest first by modification time"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if PROFILE_NAME.match(name):
+                try:
+                    entries.append((os.stat(os.path.join(self.directory, name)).st_mtime_ns, name))
+                except OSError:
+                    continue  # Pruned by another worker
+        return [name for _, name in sorted(entries)]
+
+    def save(self, name, profile, meta):
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(path)
+        with open(path + ".json", "w") as f:
+            json.dump(dict(meta, name=name), f)
+        self.prune()
+
+    def prune(self):
+        """Drop the oldest profiles beyond `keep`"""
+        names = self._names_by_age()
+        for name in names[:max(0, len(names) - self.keep)]:
+            for path in (os.path.join(self.directory, name), os.path.join(self.directory, name + ".json")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def list(self):
+        profiles = []
+        for name in reversed(self._names_by_age()):
+            try:
+                with open(os.path.join(self.directory, name + ".json")) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                profiles.append({"name": name})
+        return profiles
+
+    def path(self, name):
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+
+def init_app(app, service, token=None, sample_rate=None, directory=None, keep=None):
+    """
+    Add opt-in request profiling and /debug/profiles to a Flask app
+
+    Args:
+        app: Flask application
+        service: Service name; each service gets its own ring buffer
+        token: X-Profile secret (default: AGENT_PROFILE_TOKEN)
+        sample_rate: Fraction of requests to profile (default: AGENT_PROFILE_SAMPLE_RATE)
+        directory: Ring buffer root (default: AGENT_PROFILE_DIR)
+        keep: Profiles kept (default: AGENT_PROFILE_KEEP)
+
+    Returns:
+        ProfileStore, or None when profiling is disabled
+    """
+    token = token if token is not None else os.getenv("AGENT_PROFILE_TOKEN", "")
+    if sample_rate is None:
+        sample_rate = float(os.getenv("AGENT_PROFILE_SAMPLE_RATE", "0"))
+    if not token and sample_rate <= 0:
+        return None
+
+    directory = directory or os.getenv("AGENT_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "agent-profiles"))
+    keep = keep or int(os.getenv("AGENT_PROFILE_KEEP", "50"))
+    store = ProfileStore(os.path.join(directory, service), keep)
+
+    def authorized(value):
+        # Compared as bytes: compare_digest rejects non-ASCII str
+        return bool(token) and value is not None and hmac.compare_digest(value.encode(), token.encode())
+
+    @app.before_request
+    def start_profile():
+        if not (authorized(request.headers.get(PROFILE_HEADER))
+                or (sample_rate > 0 and random.random() < sample_rate)):
+            return
+        if request.endpoint in ("list_profiles", "download_profile", "metrics"):
+            return
+        if not _profiler_lock.acquire(blocking=False):
+            return  # Another request is being profiled
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            _profiler_lock.release()  # Some other profiler is active
+            return
+        g.profile = profile
+        g.profile_start = time.perf_counter()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop("profile", None)
+        if profile is None:
+            return response
+        request_id = current_request_id()
+        name = store.new_name(request_id)
+        meta = {
+            "service": service,
+            "endpoint": request.endpoint,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "requestId": request_id
+        }
+        start = g.profile_start
+
+        def stop():
+            # Runs once the response body is sent, so streamed work is included
+            profile.disable()
+            _profiler_lock.release()
+            meta["seconds"] = round(time.perf_counter() - start, 6)
+            meta["createdAt"] = time.time()
+            try:
+                store.save(name, profile, meta)
+            except OSError as e:
+                print(f"Profile save error: {e}")
+
+        response.call_on_close(stop)
+        response.headers[PROFILE_ID_HEADER] = name
+        return response
+
+    def require_access():
+        if token:
+            # Header only: a token in the query string ends up in access logs
+            if not authorized(request.headers.get(PROFILE_HEADER)):
+                abort(403)
+        elif request.remote_addr not in ("127.0.0.1", "::1"):
+            abort(403)  # Without a token, only local callers may read profiles
+
+    @app.route("/debug/profiles", methods=["GET"], endpoint="list_profiles")
+    def list_profiles():
+        """List stored profiles, newest first"""
+        require_access()
+        return jsonify({"success": True, "profiles": store.list()}), 200
+
+    @app.route("/debug/profiles/<name>", methods=["GET"], endpoint="download_profile")
+    def download_profile(name):
+        """Download a pstats file, or ?format=text for the top functions"""
+        require_access()
+        path = store.path(name)
+        if path is None:
+            abort(404)
+        if request.args.get("format") == "text":
+            output = io.StringIO()
+            stats = pstats.Stats(path, stream=output)
+            sort = request.args.get("sort", "cumulative")
+            if sort not in ("cumulative", "tottime", "ncalls", "filename"):
+                sort = "cumulative"
+            stats.sort_stats(sort).print_stats(request.args.get("limit", 40, type=int))
+            return Response(output.getvalue(), mimetype="text/plain")
+        return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=name)
+
+    return store
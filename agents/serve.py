@@ -0,0 +1,146 @@
+"""
+Production launcher for the agents.
+
+Serves one agent, or several agents in one process under route prefixes
+(/caption, /image, /music), with gunicorn worker processes and threads.
+
+Usage:
+    python serve.py image --workers 4 --threads 2
+    python serve.py caption music --port 8000
+    python serve.py all --port 8000
+    python serve.py music --dev          # Flask dev server, for comparison
+"""
+import os
+import argparse
+import tempfile
+import importlib
+
+from werkzeug.exceptions import NotFound
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+
+# Agent name -> (module, default port, route prefix when combined)
+AGENTS = {
+    "caption": ("optiapp", 5000, "/caption"),
+    "image": ("imageapp", 5001, "/image"),
+    "music": ("musicapp", 5004, "/music")
+}
+
+# Heavy imports loaded once in the master before workers are forked
+PRELOAD_MODULES = ["numpy", "cv2", "PIL.Image", "requests"]
+
+
+def preload_modules():
+    """Import heavy shared dependencies so forked workers inherit them"""
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"Preload skipped for {name}: {e}")
+
+
+def load_app(agent_names):
+    """
+    Build the WSGI application for the selected agents
+
+    Args:
+        agent_names: List of agent names from AGENTS
+
+    Returns:
+        WSGI application
+    """
+    if len(agent_names) == 1:
+        module_name = AGENTS[agent_names[0]][0]
+        return importlib.import_module(module_name).app
+
+    mounts = {}
+    for name in agent_names:
+        module_name, _, prefix = AGENTS[name]
+        mounts[prefix] = importlib.import_module(module_name).app
+    return DispatcherMiddleware(NotFound(), mounts)
+
+
+def run_gunicorn(app, options):
+    """Serve app with gunicorn using the given config options"""
+    from gunicorn.app.base import BaseApplication
+
+    class AgentApplication(BaseApplication):
+        def __init__(self, application, config):
+            self.application = application
+            self.config_options = config
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.config_options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    AgentApplication(app, options).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run agents under a production WSGI server")
+    parser.add_argument("agents", nargs="+", choices=list(AGENTS) + ["all"], help="Agents to serve")
+    parser.add_argument("--host", default=os.getenv("AGENT_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=None, help="Port (defaults to the agent's usual port, 8000 when combined)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AGENT_WORKERS", "2")), help="Worker processes")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("AGENT_THREADS", "4")), help="Threads per worker")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("AGENT_TIMEOUT", "120")), help="Worker request timeout (seconds)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("AGENT_GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds to finish in-flight requests on shutdown")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("AGENT_MAX_REQUESTS", "0")),
+                        help="Recycle a worker after this many requests (0 disables)")
+    parser.add_argument("--access-log", action="store_true", help="Log every request to stdout")
+    parser.add_argument("--dev", action="store_true", help="Use the Flask development server instead")
+    args = parser.parse_args()
+
+    agent_names = list(AGENTS) if "all" in args.agents else list(dict.fromkeys(args.agents))
+    if args.port is None:
+        args.port = AGENTS[agent_names[0]][1] if len(agent_names) == 1 else 8000
+
+    preload_modules()
+    if "image" in agent_names:
+        # No worker is running yet, so every staged image is left over from
+        # an earlier run
+        from shared_images import release_orphaned_images
+        removed = release_orphaned_images()
+        if removed:
+            print(f"Released {removed} shared image(s) from a previous run")
+    if not args.dev:
+        # Workers add their metrics up through this directory, so /metrics
+        # reports the whole server whichever worker answers the scrape.
+        # Set before the agents (and their metrics registry) are imported
+        metrics_dir = os.environ.setdefault(
+            "AGENT_METRICS_DIR", os.path.join(tempfile.gettempdir(), f"agent-metrics-{args.port}"))
+        from instrumentation import reset_metrics_dir
+        reset_metrics_dir(metrics_dir)
+    app = load_app(agent_names)
+
+    print(f"Serving {', '.join(agent_names)} on http://{args.host}:{args.port}")
+    if len(agent_names) > 1:
+        for name in agent_names:
+            print(f"  {name}: {AGENTS[name][2]}")
+
+    if args.dev:
+        from werkzeug.serving import run_simple
+        run_simple(args.host, args.port, app, threaded=True, use_reloader=False)
+        return
+
+    run_gunicorn(app, {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread" if args.threads > 1 else "sync",
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10 if args.max_requests else 0,
+        "preload_app": True,
+        "accesslog": "-" if args.access_log else None
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Shared-memory image handoff for co-located agents.
+
+An image is fetched and decoded once, then published as raw RGB pixels in a
+named shared-memory segment. The segment name doubles as the handle that other
+agents on the same host use to read the pixels without another download or
+decode.
+
+Every staging gets its own segment, owned by the caller until it releases the
+handle, so one caller's release never removes pixels another is still
+reading. Handles start with a hash of the source content, which lets a repeat
+staging copy pixels from a live segment instead of decoding again.
+"""
+import os
+import time
+import struct
+import hashlib
+import secrets
+import threading
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Kept short: macOS limits shared-memory names to 31 characters
+HANDLE_PREFIX = "agimg_"
+HANDLE_HEX_LENGTH = 24
+# Leading hex digits of a handle taken from the content hash; the rest is random
+CONTENT_HEX_LENGTH = 16
+
+# magic, width, height, channels; pixels start at HEADER_SIZE
+HEADER_FORMAT = "<4sIII"
+HEADER_MAGIC = b"AIMG"
+HEADER_SIZE = 64
+
+# Where POSIX shared memory lives on Linux
+SHM_DIR = "/dev/shm"
+
+
+class SharedImageMissing(LookupError):
+    """Raised when a handle no longer names a published image"""
+
+    def __init__(self, handle):
+        super().__init__(f"Shared image {handle} is not available")
+        self.handle = handle
+
+
+def content_key(data):
+    """Handle prefix shared by every staging of the same content"""
+    return HANDLE_PREFIX + hashlib.sha256(data).hexdigest()[:CONTENT_HEX_LENGTH]
+
+
+def new_handle(key):
+    """Unique handle for one staging of the content behind `key`"""
+    return key + secrets.token_hex((HANDLE_HEX_LENGTH - CONTENT_HEX_LENGTH) // 2)
+
+
+def is_handle(value):
+    return (isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+            and len(value) == len(HANDLE_PREFIX) + HANDLE_HEX_LENGTH)
+
+
+def segment_size(array):
+    """Bytes a published copy of `array` takes in shared memory"""
+    return HEADER_SIZE + array.nbytes
+
+
+def shm_free_bytes():
+    """Free space for new segments, or None where it can't be measured"""
+    try:
+        stat = os.statvfs(SHM_DIR)
+    except (OSError, AttributeError):
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def staged_segments():
+    """(handle, size, mtime) of every published image on this host"""
+    try:
+        names = [name for name in os.listdir(SHM_DIR) if is_handle(name)]
+    except OSError:
+        return []
+    segments = []
+    for name in names:
+        try:
+            stat = os.stat(os.path.join(SHM_DIR, name))
+        except OSError:
+            continue  # Released meanwhile
+        segments.append((name, stat.st_size, stat.st_mtime))
+    return segments
+
+
+def find_image(key):
+    """A published image with the same content as `key`, or None"""
+    for name, _, _ in staged_segments():
+        if name.startswith(key):
+            return name
+    return None
+
+
+def release_orphaned_images():
+    """
+    Unlink every published image left behind by an earlier run
+
+    Segments are untracked, so they survive the process that created them.
+    Only call this before any agent process that may be publishing starts.
+
+    Returns:
+        Number of segments removed
+    """
+    try:
+        names = [name for name in os.listdir(SHM_DIR) if is_handle(name)]
+    except OSError:
+        return 0
+    return sum(release_image(name) for name in names)
+
+
+def _untrack(shm):
+    # Segments outlive the process that created or attached them; lifetime is
+    # managed explicitly with release_image
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def publish_array(handle, array):
+    """
+    Copy an (h, w, 3) uint8 RGB array into a new shared-memory segment
+
+    Args:
+        handle: Handle from new_handle
+        array: Pixel array (may itself be a SharedImage view)
+
+    Returns:
+        True if the segment was created, False if it already existed
+
+    Raises:
+        OSError: Not enough shared memory (the segment is removed again)
+    """
+    height, width, channels = array.shape
+    try:
+        shm = shared_memory.SharedMemory(name=handle, create=True, size=segment_size(array))
+    except FileExistsError:
+        return False
+
+    _untrack(shm)
+    try:
+        # Reserve the pages up front: writing into a full tmpfs raises SIGBUS
+        # instead of an error
+        if hasattr(os, "posix_fallocate") and getattr(shm, "_fd", -1) >= 0:
+            try:
+                os.posix_fallocate(shm._fd, 0, shm.size)
+            except OSError:
+                shm.close()
+                shm.unlink()
+                raise
+        view = np.ndarray(array.shape, dtype=np.uint8, buffer=shm.buf, offset=HEADER_SIZE)
+        view[...] = array
+        del view
+        # Header last, so readers never see a valid header over partial pixels
+        struct.pack_into(HEADER_FORMAT, shm.buf, 0, HEADER_MAGIC, width, height, channels)
+    finally:
+        shm.close()
+    return True
+
+
+class SharedImage:
+    """
+    Read-only view of a published image
+
+    Use as a context manager; `array` is only valid until the block exits.
+
+    Raises:
+        ValueError: Malformed handle
+        SharedImageMissing: Nothing (complete) is published under the handle
+    """
+
+    def __init__(self, handle):
+        if not is_handle(handle):
+            raise ValueError(f"Invalid image handle: {handle!r}")
+        try:
+            self.shm = shared_memory.SharedMemory(name=handle)
+        except FileNotFoundError:
+            raise SharedImageMissing(handle) from None
+        _untrack(self.shm)
+        magic, width, height, channels = struct.unpack_from(HEADER_FORMAT, self.shm.buf, 0)
+        if magic != HEADER_MAGIC:
+            self.shm.close()
+            raise SharedImageMissing(handle)
+        self.array = np.ndarray((height, width, channels), dtype=np.uint8, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.array.flags.writeable = False
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def image_exists(handle):
+    try:
+        SharedImage(handle).close()
+    except (ValueError, SharedImageMissing):
+        return False
+    return True
+
+
+def release_image(handle):
+    """Unlink a published image; returns False if it did not exist"""
+    if not is_handle(handle):
+        return False
+    try:
+        shm = shared_memory.SharedMemory(name=handle)
+    except FileNotFoundError:
+        return False
+    # unlink() also drops the resource tracker entry registered on attach
+    shm.close()
+    shm.unlink()
+    return True
+
+
+class SharedImageRegistry:
+    """
+    Host-wide size cap on published images
+
+    Usage is measured from SHM_DIR, so it covers every agent process on the
+    host. Images are never unlinked to make room while their lease is live;
+    only images older than `lease_seconds` (a caller that died before
+    releasing) are reclaimed. Where SHM_DIR can't be listed only the
+    single-image limit applies.
+    """
+
+    def __init__(self, capacity_bytes, lease_seconds):
+        self.capacity_bytes = capacity_bytes
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+
+    def reserve(self, size):
+        """True if `size` more bytes fit, after reclaiming expired images"""
+        if size > self.capacity_bytes:
+            return False
+        with self.lock:
+            segments = sorted(staged_segments(), key=lambda segment: segment[2])
+            total = sum(segment_bytes for _, segment_bytes, _ in segments)
+            expired = time.time() - self.lease_seconds
+            for name, segment_bytes, mtime in segments:
+                if total + size <= self.capacity_bytes or mtime > expired:
+                    break
+                if release_image(name):
+                    print(f"Reclaimed shared image {name} after its lease expired")
+                    total -= segment_bytes
+            return total + size <= self.capacity_bytes
@@ -6,6 +6,10 @@ import { DraftPost } from '../models/DraftPost.js';
 const PYTHON_AGENT_BASE_URL = process.env.PYTHON_AGENT_URL || 'http://localhost:5000';
 const MUSIC_AGENT_URL = process.env.MUSIC_SUGGESTION_AGENT_URL || 'http://localhost:5004';
 const VIDEO_AGENT_URL = process.env.VIDEO_GENERATION_AGENT_URL || 'https://untidier-papal-aubrie.ngrok-free.dev';
+const IMAGE_AGENT_URL = process.env.IMAGE_AGENT_URL || PYTHON_AGENT_BASE_URL.replace('5000', '5001');
+
+// Co-located mode: caption and image agents share one decoded copy of each image
+const SHARED_IMAGES_ENABLED = process.env.AGENT_SHARED_IMAGES === 'true';
 
 // Start agent pipeline
 export const startAgentPipeline = async ({ draftId, userId, originalCaption, originalImages, platforms }) => {
@@ -36,15 +40,24 @@ export const startAgentPipeline = async ({ draftId, userId, originalCaption, ori
         console.log('   3️⃣  Video Agent (Stable Diffusion)');
         console.log('   4️⃣  Music Agent (iTunes API)\n');
 
-        // Call all agents in parallel
-        const agentPromises = [
-            callCaptionAgent(draftId, originalCaption, platforms, originalImages),
-            callImageAgent(draftId, originalImages),
-            callVideoAgent(draftId, originalImages),
-            callMusicAgent(draftId, originalCaption, originalImages)
-        ];
-
-        Promise.all(agentPromises)
+        // Staging runs in the background too, so the draft response isn't held up
+        const staging = SHARED_IMAGES_ENABLED
+            ? stageSharedImages(draftId, originalImages)
+            : Promise.resolve(null);
+
+        staging
+            .then((sharedHandles) => {
+                // Call all agents in parallel
+                const agentPromises = [
+                    callCaptionAgent(draftId, originalCaption, platforms, originalImages, sharedHandles),
+                    callImageAgent(draftId, originalImages, sharedHandles),
+                    callVideoAgent(draftId, originalImages),
+                    callMusicAgent(draftId, originalCaption, originalImages)
+                ];
+
+                return Promise.all(agentPromises)
+                    .finally(() => releaseSharedImages(sharedHandles));
+            })
             .then(async ([captions, images, video, music]) => {
                 console.log('\n✅ ALL AGENTS COMPLETED SUCCESSFULLY');
                 console.log('━'.repeat(80));
@@ -81,8 +94,51 @@ export const startAgentPipeline = async ({ draftId, userId, originalCaption, ori
     }
 };
 
+// Stage images once in shared memory for the co-located caption and image agents
+const stageSharedImages = async (draftId, images) => {
+    console.log('📦 Staging images in shared memory...');
+
+    const results = await Promise.allSettled(images.map(async (img) => {
+        const response = await axios.post(`${IMAGE_AGENT_URL}/images/stage`, {
+            url: img.url
+        }, {
+            timeout: 30000,
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Request-ID': String(draftId)
+            }
+        });
+        return response.data.handle;
+    }));
+
+    const handles = results
+        .filter((result) => result.status === 'fulfilled')
+        .map((result) => result.value);
+    const failure = results.find((result) => result.status === 'rejected');
+
+    if (failure) {
+        // Don't leak the images that did stage
+        await releaseSharedImages(handles);
+        console.warn(`   ⚠️  Shared image staging failed, sending image URLs instead: ${failure.reason.message}\n`);
+        return null;
+    }
+
+    console.log(`   ✓ ${handles.length} image(s) staged\n`);
+    return handles;
+};
+
+// Release staged images once every agent has finished
+const releaseSharedImages = async (handles) => {
+    if (!handles) return;
+
+    await Promise.all(handles.map((handle) =>
+        axios.delete(`${IMAGE_AGENT_URL}/images/${handle}`, { timeout: 10000 })
+            .catch((error) => console.warn(`   ⚠️  Failed to release ${handle}: ${error.message}`))
+    ));
+};
+
 // Call Caption Agent
-const callCaptionAgent = async (draftId, caption, platforms, images) => {
+const callCaptionAgent = async (draftId, caption, platforms, images, sharedHandles = null) => {
     const agentStart = Date.now();
     console.log('\n1️⃣  CAPTION AGENT - START');
     console.log('─'.repeat(80));
@@ -106,27 +162,46 @@ const callCaptionAgent = async (draftId, caption, platforms, images) => {
 
             if (platform === 'instagram') {
                 console.log(`   🖼️  Processing for ${platform}`);
-                console.log(`   📥 Downloading image: ${imageUrl.substring(0, 60)}...`);
 
-                const formData = new FormData();
-                const imageResponse = await axios.get(imageUrl, { responseType: 'arraybuffer' });
-                formData.append('image', Buffer.from(imageResponse.data), {
-                    filename: 'image.jpg',
-                    contentType: 'image/jpeg'
-                });
-                formData.append('intent', caption || 'Generate engaging caption for social media');
+                const postCaption = async (sharedHandle) => {
+                    const formData = new FormData();
+                    if (sharedHandle) {
+                        console.log(`   📦 Using shared image: ${sharedHandle}`);
+                        formData.append('imageHandle', sharedHandle);
+                    } else {
+                        console.log(`   📥 Downloading image: ${imageUrl.substring(0, 60)}...`);
+                        const imageResponse = await axios.get(imageUrl, { responseType: 'arraybuffer' });
+                        formData.append('image', Buffer.from(imageResponse.data), {
+                            filename: 'image.jpg',
+                            contentType: 'image/jpeg'
+                        });
+                    }
+                    formData.append('intent', caption || 'Generate engaging caption for social media');
+
+                    console.log(`   🤖 Calling Gemini AI...`);
+                    return axios.post(
+                        `${PYTHON_AGENT_BASE_URL}/api/instagram/optimize`,
+                        formData,
+                        {
+                            headers: {
+                                ...formData.getHeaders(),
+                                'X-Request-ID': String(draftId)
+                            },
+                            timeout: 30000
+                        }
+                    );
+                };
 
-                console.log(`   🤖 Calling Gemini AI...`);
                 const callStart = Date.now();
-
-                const response = await axios.post(
-                    `${PYTHON_AGENT_BASE_URL}/api/instagram/optimize`,
-                    formData,
-                    {
-                        headers: formData.getHeaders(),
-                        timeout: 30000
-                    }
-                );
+                let response;
+                try {
+                    response = await postCaption(sharedHandles ? sharedHandles[0] : null);
+                } catch (error) {
+                    // 410: the staged image is gone, so send the image itself
+                    if (!sharedHandles || error.response?.status !== 410) throw error;
+                    console.warn('   ⚠️  Shared image unavailable, sending the image instead');
+                    response = await postCaption(null);
+                }
 
                 const callTime = Date.now() - callStart;
 
@@ -179,7 +254,7 @@ const callCaptionAgent = async (draftId, caption, platforms, images) => {
 };
 
 // Call Image Agent
-const callImageAgent = async (draftId, images) => {
+const callImageAgent = async (draftId, images, sharedHandles = null) => {
     const agentStart = Date.now();
     console.log('\n2️⃣  IMAGE AGENT - START');
     console.log('─'.repeat(80));
@@ -190,30 +265,22 @@ const callImageAgent = async (draftId, images) => {
             { 'agentStatuses.imageAgent': 'processing' }
         );
         console.log('   Status: Processing');
-        console.log(`   📸 Converting ${images.length} image(s) to base64...`);
-
-        const imagesBase64 = [];
-        for (let i = 0; i < images.length; i++) {
-            const img = images[i];
-            try {
-                const response = await axios.get(img.url, { responseType: 'arraybuffer' });
-                const base64 = Buffer.from(response.data).toString('base64');
-                imagesBase64.push(`data:image/jpeg;base64,${base64}`);
-                console.log(`   ✓ Image ${i + 1}/${images.length} converted`);
-            } catch (error) {
-                console.error(`   ❌ Failed to download image ${i + 1}: ${error.message}`);
-            }
-        }
 
-        if (imagesBase64.length === 0) {
-            throw new Error('No images could be processed');
+        // The agent downloads the images itself, so their bytes never pass through here
+        const urlSource = { imageUrls: images.map((img) => img.url) };
+        let imageSource = urlSource;
+        if (sharedHandles) {
+            console.log(`   📦 Using ${sharedHandles.length} shared image(s)`);
+            imageSource = { handles: sharedHandles };
+        } else {
+            console.log(`   🔗 Sending ${images.length} image URL(s)`);
         }
 
         console.log(`   🎨 Applying filters: enhanced, vibrant, professional, bold`);
         const callStart = Date.now();
 
-        const response = await axios.post(`${PYTHON_AGENT_BASE_URL.replace('5000', '5001')}/process-images`, {
-            images: imagesBase64,
+        const postImages = (source) => axios.post(`${IMAGE_AGENT_URL}/process-images`, {
+            ...source,
             platform: 'instagram_post',
             filters: ['enhanced', 'vibrant', 'professional', 'bold'],
             enhance: true,
@@ -221,10 +288,29 @@ const callImageAgent = async (draftId, images) => {
         }, {
             timeout: 60000,
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-Request-ID': String(draftId)
             }
         });
 
+        let response;
+        try {
+            response = await postImages(imageSource);
+        } catch (error) {
+            if (!sharedHandles || error.response?.status !== 410) throw error;
+            response = error.response;
+        }
+        // Staged images that are gone come back as a 410, or in missingHandles
+        // if they went missing while the response was streaming
+        if (sharedHandles && response.data.missingHandles?.length) {
+            console.warn(`   ⚠️  Shared images unavailable, sending ${images.length} image URL(s) instead`);
+            response = await postImages(urlSource);
+        }
+
+        if (response.data.count === 0) {
+            throw new Error('No images could be processed');
+        }
+
         const callTime = Date.now() - callStart;
 
         await AgentJob.updateOne(
@@ -387,7 +473,8 @@ const callMusicAgent = async (draftId, caption, images) => {
         }, {
             timeout: 30000,
             headers: {
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'X-Request-ID': String(draftId)
             }
         });
 